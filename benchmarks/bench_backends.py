@@ -0,0 +1,62 @@
+"""
+Measures the per-call overhead of the lookup of the screenshot strategy of a target:
+the previous per-call module lookup, imports and type checks, against the cached backend registry.
+
+Usage:
+    python benchmarks/bench_backends.py [--calls N]
+"""
+import argparse
+import importlib.util
+import common
+from pytest_webtest_extras import backends
+from pytest_webtest_extras.extras import Extras
+
+
+class FakeDriver:
+    """ Driver-like target returning a constant screenshot. """
+
+    def get_screenshot_as_png(self):
+        return b"\x89PNG"
+
+
+class FakeChromeDriver(FakeDriver):
+    pass
+
+
+def legacy_lookup(target):
+    """ Emulation of the lookup previously done by screenshot_selenium at each call. """
+    if importlib.util.find_spec('pytest') is not None:
+        from _pytest.python import Class as A
+        from _pytest.python import Function as B
+        from _pytest.python import Module as C
+        from _pytest.nodes import Node as D
+    if isinstance(target, D):
+        return "element"
+    if hasattr(target, "get_full_page_screenshot_as_png"):
+        return "firefox"
+    if type(target) in (A, B, C):
+        return "chromium"
+    return "driver"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+    backends.register(FakeDriver, lambda extras, target, full_page: target.get_screenshot_as_png(), name="fake")
+    target = FakeChromeDriver()
+
+    seconds = common.measure(lambda: [legacy_lookup(target) for _ in range(args.calls)])
+    common.show("legacy lookup (find_spec + imports + checks)", seconds, args.calls)
+    seconds = common.measure(lambda: [backends.resolve(target) for _ in range(args.calls)])
+    common.show("backends.resolve (cached)", seconds, args.calls)
+
+    # Whole capture path, without persistence
+    report = Extras(None, "all", True, False, False)
+    report._record = lambda *a: None
+    seconds = common.measure(lambda: [report.screenshot(target, "step") for _ in range(args.calls)])
+    common.show("Extras.screenshot (capture path)", seconds, args.calls)
+
+
+if __name__ == "__main__":
+    main()
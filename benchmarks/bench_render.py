@@ -0,0 +1,73 @@
+"""
+Compares the rendering of the steps of a test in pytest_runtest_makereport:
+the previous string concatenation against render_steps, which builds the steps with the shared fragment helpers.
+Both render the same HTML code, at about the same speed.
+
+Usage:
+    python benchmarks/bench_render.py
+"""
+import common
+from pytest_webtest_extras import utils
+
+
+#
+# Previous implementation
+#
+def legacy_decorate_screenshot(filename, thumbnail=None):
+    clazz = "extras_image"
+    src = filename if thumbnail is None else thumbnail
+    return f'<a href="{filename}" target="_blank"><img src ="{src}" class="{clazz}" loading="lazy"></a>'
+
+
+def legacy_decorate_page_source(filename):
+    clazz = "extras_page_src"
+    return f'<a href="{filename}" target="_blank" class="{clazz}">[page source]</a>'
+
+
+def legacy_get_table_row_tag(comment, image, source, thumbnail=None):
+    clazz = "extras_comment"
+    image = legacy_decorate_screenshot(image, thumbnail)
+    comment = f'<span class="{clazz}">{comment}</span>'
+    if source is not None:
+        source = legacy_decorate_page_source(source)
+        return (
+            f"<tr>"
+            f"<td>{comment}</td>"
+            f'<td class="extras_td"><div class="extras_td_div">{image}<br>{source}</div></td>'
+            f"</tr>"
+        )
+    else:
+        return (
+            f"<tr>"
+            f"<td>{comment}</td>"
+            f'<td class="extras_td"><div class="extras_td_div">{image}</div></td>'
+            "</tr>"
+        )
+
+
+def legacy_render(images, sources, thumbnails, comments):
+    rows = ""
+    for i in range(len(images)):
+        rows += legacy_get_table_row_tag(comments[i], images[i], sources[i], thumbnails[i])
+    return '<table style="width: 100%;">' + rows + "</table>"
+
+
+def main():
+    for steps in (10, 1000, 50000):
+        images = [f"screenshots/image-{i}.png" for i in range(steps)]
+        sources = [f"sources/page-{i}.txt" if i % 2 else None for i in range(steps)]
+        thumbnails = [None] * steps
+        comments = [f"Step {i}" for i in range(steps)]
+        assert legacy_render(images, sources, thumbnails, comments) == \
+            utils.render_steps(images, sources, thumbnails, comments, True)
+        assert "".join(utils.decorate_anchors(images[i], sources[i], thumbnails[i]) for i in range(steps)) == \
+            utils.render_steps(images, sources, thumbnails, comments, False)
+        repeat = 5 if steps < 50000 else 3
+        seconds = common.measure(lambda: legacy_render(images, sources, thumbnails, comments), repeat)
+        common.show(f"concatenation, {steps} steps", seconds, steps)
+        seconds = common.measure(lambda: utils.render_steps(images, sources, thumbnails, comments, True), repeat)
+        common.show(f"render_steps, {steps} steps", seconds, steps)
+
+
+if __name__ == "__main__":
+    main()
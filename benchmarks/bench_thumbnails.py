@@ -0,0 +1,72 @@
+"""
+Compares the bytes the browser downloads to display the report gallery with and without screenshot previews.
+
+Usage:
+    python benchmarks/bench_thumbnails.py [--steps N] [--height PIXELS]
+
+The report open time is dominated by the download and decoding of the <img> sources,
+so the total size of the <img> sources is reported, along with the cost of writing the previews.
+Requires the Pillow package.
+"""
+import argparse
+import io
+import os
+import re
+import tempfile
+import common
+from pytest_webtest_extras import utils
+from pytest_webtest_extras.extras import Extras
+
+
+def synthetic_screenshot(width, height):
+    from PIL import Image
+    img = Image.effect_noise((width, height), 40).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def gallery_bytes(folder, html):
+    """ Returns the total size of the files referenced by the <img> elements. """
+    return sum(os.path.getsize(os.path.join(folder, src)) for src in re.findall(r'<img src ="([^"]+)"', html))
+
+
+def run(folder, thumbnails, steps, image):
+    report = Extras(folder, "all", True, False, False, thumbnails=thumbnails)
+    for i in range(steps):
+        report.save_screenshot(image, f"step {i}")
+    report.flush()
+    return "".join(
+        utils.get_table_row_tag(report.comments[i], report.images[i], report.sources[i], report.thumbnails[i])
+        for i in range(steps)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=4000)
+    args = parser.parse_args()
+    try:
+        image = synthetic_screenshot(args.width, args.height)
+    except ImportError:
+        print("Pillow module is not installed.")
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        utils.create_assets(folder)
+        for thumbnails in (False, True):
+            html = None
+
+            def step():
+                nonlocal html
+                html = run(folder, thumbnails, args.steps, image)
+            seconds = common.measure(step, repeat=1)
+            name = "with previews" if thumbnails else "without previews"
+            common.show(f"save_screenshot ({name})", seconds, args.steps)
+            print(f"{'':<48} gallery <img> bytes: {gallery_bytes(folder, html) / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compares the throughput of synchronous and background persistence of screenshots and webpage sources.
+
+Usage:
+    python benchmarks/bench_writer.py [--latency SECONDS]
+
+The --latency option adds a delay to each write in order to emulate a network file system.
+"""
+import argparse
+import os
+import tempfile
+import time
+import common
+from pytest_webtest_extras import utils
+from pytest_webtest_extras.extras import Extras
+from pytest_webtest_extras.writer import Writer
+
+
+def run(folder, writer, steps, image, source):
+    report = Extras(folder, "all", True, True, False, writer)
+    for i in range(steps):
+        report.save_screenshot(image, f"step {i}", source)
+    report.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--size", type=int, default=512 * 1024, help="Screenshot size in bytes")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.latency > 0:
+        save_image, save_source = utils.save_image, utils.save_source
+
+        def slow_image(*a, **kwargs):
+            time.sleep(args.latency)
+            return save_image(*a, **kwargs)
+
+        def slow_source(*a, **kwargs):
+            time.sleep(args.latency)
+            return save_source(*a, **kwargs)
+        utils.save_image, utils.save_source = slow_image, slow_source
+
+    image = os.urandom(args.size)
+    source = "<html>" + "x" * (args.size // 4) + "</html>"
+    nbytes = args.steps * (len(image) + len(source))
+    with tempfile.TemporaryDirectory() as folder:
+        utils.create_assets(folder)
+        seconds = common.measure(lambda: run(folder, None, args.steps, image, source), repeat=3)
+        common.show("save_screenshot (sync)", seconds, args.steps, nbytes)
+        writer = Writer(args.threads)
+        seconds = common.measure(lambda: run(folder, writer, args.steps, image, source), repeat=3)
+        common.show(f"save_screenshot (async, {args.threads} threads)", seconds, args.steps, nbytes)
+        writer.shutdown()
+
+
+if __name__ == "__main__":
+    main()
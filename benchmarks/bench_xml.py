@@ -0,0 +1,77 @@
+"""
+Compares the XML pretty-printers over documents of growing size:
+the previous regex + minidom implementation, the expat indenter and the lxml indenter (if installed).
+
+Usage:
+    python benchmarks/bench_xml.py [--max-size BYTES]
+"""
+import argparse
+import re
+import tracemalloc
+import xml.dom.minidom as xdom
+import common
+from pytest_webtest_extras import formatters
+
+
+def format_minidom(content, indent=4):
+    """ Previous implementation of Extras._format_xml_str """
+    return xdom.parseString(re.sub(r"\n\s+", "", content).replace('\n', '')).toprettyxml(indent=" " * indent)
+
+
+def format_expat(content, indent=4):
+    etree = formatters.etree
+    formatters.etree = None
+    try:
+        return formatters.format_xml_str(content, indent)
+    finally:
+        formatters.etree = etree
+
+
+def format_lxml(content, indent=4):
+    return formatters.format_xml_str(content, indent)
+
+
+def synthetic_document(size):
+    """ Returns a SOAP-like document of about 'size' bytes. """
+    item = ('<item id="{0}"><name>Item {0}</name><price currency="EUR">{0}.99</price>'
+            '<tags><tag>a</tag><tag>b</tag></tags></item>')
+    items = []
+    total = 0
+    i = 0
+    while total < size:
+        items.append(item.format(i))
+        total += len(items[-1])
+        i += 1
+    return ('<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body><items>'
+            + "".join(items) + '</items></soap:Body></soap:Envelope>')
+
+
+def peak_memory(func, content):
+    tracemalloc.start()
+    func(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-size", type=int, default=10 * 2**20, help="Up to 100 MB (minidom is very slow)")
+    parser.add_argument("--memory", action="store_true", help="Also report the peak memory (slower)")
+    args = parser.parse_args()
+    implementations = [("minidom", format_minidom), ("expat", format_expat)]
+    if formatters.etree is not None:
+        implementations.append(("lxml", format_lxml))
+    size = 1024
+    while size <= args.max_size:
+        content = synthetic_document(size)
+        repeat = 5 if size < 2**20 else 1
+        for name, func in implementations:
+            seconds = common.measure(lambda: func(content), repeat=repeat)
+            common.show(f"{name} {size // 1024} KB", seconds, nbytes=len(content))
+            if args.memory:
+                print(f"{'':<48} peak memory: {peak_memory(func, content) / 2**20:.1f} MB")
+        size *= 10
+
+if __name__ == "__main__":
+    main()
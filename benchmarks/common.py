@@ -0,0 +1,71 @@
+"""
+Auxiliary functions shared by the benchmarks.
+
+The benchmarks are plain scripts that run offline, e.g.:
+
+    python benchmarks/bench_writer.py
+
+The whole suite, with JSON results comparable across commits, is run by:
+
+    python benchmarks/run.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+def measure(func, repeat=5):
+    """
+    Runs a function several times.
+
+    Returns:
+        float: The best execution time in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def show(name, seconds, count=None, nbytes=None):
+    """ Prints the result of a benchmark. """
+    line = f"{name:<48} {seconds * 1000:10.2f} ms"
+    if count and seconds > 0:
+        line += f" {count / seconds:12.1f} ops/s"
+    if nbytes and seconds > 0:
+        line += f" {nbytes / seconds / 2**20:10.1f} MB/s"
+    print(line)
+
+
+def synthetic_png(width=1280, height=2000):
+    """ Returns a valid RGB PNG image with some noise, so that it doesn't compress to nothing. """
+    import random
+    import struct
+    import zlib
+    rnd = random.Random(0)
+    row = bytes(rnd.getrandbits(8) for _ in range(width * 3))
+    raw = b"".join(b"\x00" + row[i % 64:] + row[:i % 64] for i in range(height))
+
+    def chunk(chunk_type, data):
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1))
+            + chunk(b"IEND", b""))
+
+
+def synthetic_source(size):
+    """ Returns a HTML webpage source of about 'size' bytes. """
+    row = '<tr><td class="cell">{0}</td><td><a href="/item/{0}">Item {0}</a></td></tr>\n'
+    rows = []
+    total = 0
+    i = 0
+    while total < size:
+        rows.append(row.format(i))
+        total += len(rows[-1])
+        i += 1
+    return "<html><body><table>\n" + "".join(rows) + "</table></body></html>"
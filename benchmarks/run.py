@@ -0,0 +1,457 @@
+"""
+Benchmark suite of the hot paths of the plugin.
+
+It runs offline, with fake webdrivers and report objects and synthetic screenshots, webpage sources and payloads.
+The results can be saved as JSON and compared against the results of another commit in order to catch regressions.
+
+Usage:
+    python benchmarks/run.py [--quick] [--filter TEXT] [--output FILE] [--compare BASELINE] [--threshold RATIO]
+
+Example:
+    git checkout main && python benchmarks/run.py --output /tmp/main.json
+    git checkout feature && python benchmarks/run.py --compare /tmp/main.json
+
+The comparison exits with status 1 if a benchmark is slower than the baseline by more than the threshold.
+"""
+import argparse
+import base64
+import importlib.metadata
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import types
+import common
+from pytest_webtest_extras import backends
+from pytest_webtest_extras import formatters
+from pytest_webtest_extras import options
+from pytest_webtest_extras import plugin
+from pytest_webtest_extras import utils
+from pytest_webtest_extras.extras import Extras
+from pytest_webtest_extras.pack import Pack
+
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+#
+# Fake objects
+#
+class FakeDriver:
+    """ Webdriver returning a constant screenshot and webpage source. """
+
+    def __init__(self, image, source):
+        self._image = image
+        self.page_source = source
+
+    def get_screenshot_as_png(self):
+        return self._image
+
+
+backends.register(
+    FakeDriver,
+    lambda extras, target, full_page: target.get_screenshot_as_png(),
+    lambda target: target.page_source,
+    name="fake",
+    owner=lambda target: target,
+)
+
+
+class FakeHtml:
+    """ pytest-html plugin """
+    extras = types.SimpleNamespace(html=lambda content: {"format_type": "html", "content": content})
+
+
+class FakeRequest:
+
+    def __init__(self, fixtures):
+        self._fixtures = fixtures
+
+    def getfixturevalue(self, name):
+        return self._fixtures[name]
+
+
+# Stands in for the pytest-html plugin in the pytest sessions of bench_session, if it is not installed.
+FAKE_HTML_CONFTEST = """
+import types
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption("--html", default=None)
+    parser.addoption("--css", default=None)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    extras = types.SimpleNamespace(html=lambda content: {"format_type": "html", "content": content})
+    config.pluginmanager.register(types.SimpleNamespace(extras=extras), "html")
+"""
+
+
+def fake_item(report):
+    def test():
+        """ Test description """
+    opts = options.Options(**dict.fromkeys(options.Options._fields))._replace(
+        html_plugin=FakeHtml,
+        description_tag="pre",
+        screenshots="all",
+        comments=True,
+    )
+    request = FakeRequest({"report": report})
+    return types.SimpleNamespace(
+        config=types.SimpleNamespace(stash={options.key: opts}),
+        funcargs={"request": request, "report": report},
+        function=test,
+        nodeid="test_bench.py::test",
+    )
+
+
+def fake_report():
+    return types.SimpleNamespace(when="call", failed=False, passed=True, skipped=False, extras=[], sections=[])
+
+
+def run_makereport(item, call):
+    """ Runs the pytest_runtest_makereport hook wrapper of the plugin around a fake report. """
+    report = fake_report()
+    hook = plugin.pytest_runtest_makereport(item, call)
+    next(hook)
+    try:
+        hook.send(types.SimpleNamespace(get_result=lambda: report))
+    except StopIteration:
+        pass
+    return report
+
+
+#
+# Benchmarks
+# Each benchmark yields tuples (name, seconds, count, nbytes) with the time of 'count' operations.
+#
+def bench_save_screenshot(folder, args):
+    image = common.synthetic_png(args.width, args.height)
+    encoded = base64.b64encode(image).decode()
+    source = common.synthetic_source(args.source_size)
+    steps = args.steps
+    for name, data in (("bytes", image), ("base64", encoded)):
+        def run():
+            report = Extras(folder, "all", True, True, False)
+            for i in range(steps):
+                report.save_screenshot(data, f"step {i}", source)
+            report.flush()
+        seconds = common.measure(run, args.repeat)
+        yield f"save_screenshot ({name})", seconds, steps, steps * (len(data) + len(source))
+
+
+def bench_screenshot(folder, args):
+    image = common.synthetic_png(args.width, args.height)
+    driver = FakeDriver(image, common.synthetic_source(args.source_size))
+    steps = args.steps
+
+    def run():
+        report = Extras(folder, "all", True, True, False)
+        for i in range(steps):
+            report.screenshot(driver, f"step {i}", full_page=False)
+        report.flush()
+    yield "screenshot (fake driver)", common.measure(run, args.repeat), steps, None
+
+
+def bench_save_files(folder, args):
+    image = common.synthetic_png(args.width, args.height)
+    source = common.synthetic_source(args.source_size)
+    steps = args.steps
+    seconds = common.measure(lambda: [utils.save_image(folder, i, image) for i in range(steps)], args.repeat)
+    yield "save_image", seconds, steps, steps * len(image)
+    seconds = common.measure(lambda: [utils.save_source(folder, i, source) for i in range(steps)], args.repeat)
+    yield "save_source", seconds, steps, steps * len(source)
+    seconds = common.measure(
+        lambda: [utils.save_source(folder, i, source, "gzip") for i in range(steps)], args.repeat)
+    yield "save_source (gzip)", seconds, steps, steps * len(source)
+    changed = source.replace("Item 10<", "Item 10 changed<")
+    seconds = common.measure(
+        lambda: [utils.save_source(folder, i, changed, "delta", ("sources/page-0.txt", source)) for i in range(steps)],
+        args.repeat)
+    yield "save_source (delta)", seconds, steps, steps * len(source)
+    storage = Pack(folder, "bench")
+    seconds = common.measure(
+        lambda: [utils.save_image(folder, i, image, pack=storage) for i in range(steps)], args.repeat)
+    yield "save_image (pack)", seconds, steps, steps * len(image)
+    seconds = common.measure(
+        lambda: [utils.save_source(folder, i, source, pack=storage) for i in range(steps)], args.repeat)
+    yield "save_source (pack)", seconds, steps, steps * len(source)
+    storage.close()
+
+
+def bench_makereport(folder, args):
+    call = types.SimpleNamespace(excinfo=None)
+    count = 200
+    for steps in (1, 10, 100):
+        report = Extras(folder, "all", True, True, False)
+        for i in range(steps):
+            report.images.append(utils.get_image_link(i))
+            report.thumbnails.append(None)
+            report.sources.append(utils.get_source_link(i))
+            report.comments.append(f"step {i}")
+        item = fake_item(report)
+        seconds = common.measure(lambda: [run_makereport(item, call) for _ in range(count)], args.repeat)
+        yield f"pytest_runtest_makereport ({steps} steps)", seconds, count, None
+
+
+def run_session(folder, tests, fixture):
+    """ Runs a pytest session in a subprocess with a number of tests, using a fixture or not. """
+    signature = "report" if fixture else ""
+    with open(os.path.join(folder, "test_session.py"), 'w') as f:
+        for i in range(tests):
+            f.write(f"def test_{i}({signature}):\n    pass\n\n\n")
+    command = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", f"--html={folder}/report.html"]
+    try:
+        importlib.metadata.distribution("pytest-webtest-extras")
+    except importlib.metadata.PackageNotFoundError:
+        command += ["-p", "pytest_webtest_extras.plugin"]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC, os.environ.get("PYTHONPATH", "")]))
+    subprocess.run(command + ["test_session.py"], cwd=folder, env=env, capture_output=True, check=True)
+
+
+def bench_session(folder, args):
+    folder = os.path.join(folder, "session")
+    os.makedirs(folder, exist_ok=True)
+    if not backends.is_installed('pytest_html'):
+        with open(os.path.join(folder, "conftest.py"), 'w') as f:
+            f.write(FAKE_HTML_CONFTEST)
+    tests = args.tests
+    without = common.measure(lambda: run_session(folder, tests, False), args.repeat)
+    with_report = common.measure(lambda: run_session(folder, tests, True), args.repeat)
+    yield f"pytest session ({tests} tests)", without, tests, None
+    yield f"pytest session ({tests} tests with report)", with_report, tests, None
+    # Time added to each test by the fixtures and report hook of the plugin
+    yield "per-test overhead of the report fixture", max(0.0, with_report - without) / tests, 1, None
+
+
+def bench_similarity(folder, args):
+    if backends.is_installed('numpy') and backends.is_installed('PIL'):
+        image = common.synthetic_png(args.width, args.height)
+        previous = utils.get_signature(image)
+        seconds = common.measure(lambda: utils.get_difference(utils.get_signature(image), previous), args.repeat)
+        yield "near-duplicate comparison", seconds, 1, len(image)
+
+
+def bench_create_assets(folder, args):
+    image = common.synthetic_png(64, 64)
+    source = common.synthetic_source(1024)
+    files = args.files
+
+    def populate():
+        utils.create_assets(folder).join()
+        for i in range(files):
+            utils.save_image(folder, i, image)
+            utils.save_source(folder, i, source)
+
+    def run(wait):
+        populate()
+        threads = []
+        seconds = common.measure(lambda: threads.append(utils.create_assets(folder)), repeat=1)
+        if wait:
+            seconds = common.measure(threads[0].join, repeat=1) + seconds
+        else:
+            threads[0].join()
+        return seconds
+    # Time before the first test can run, and time until the previous run is deleted.
+    yield f"create_assets ({files} files)", min(run(False) for _ in range(args.repeat)), 1, None
+    yield f"create_assets + cleanup ({files} files)", min(run(True) for _ in range(args.repeat)), 1, None
+
+
+def synthetic_json(size):
+    item = '{{"id": {0}, "name": "Item {0}", "price": {0}.99, "tags": ["a", "b"], "stock": {{"eu": {0}, "us": null}}}}'
+    items = []
+    total = 0
+    i = 0
+    while total < size:
+        items.append(item.format(i))
+        total += len(items[-1])
+        i += 1
+    return '{"items": [' + ",".join(items) + ']}'
+
+
+def synthetic_yaml(size):
+    item = "- id: {0}\n  name: Item {0}\n  price: {0}.99\n  tags: [a, b]\n  stock: {{eu: {0}, us: null}}\n"
+    items = []
+    total = 0
+    i = 0
+    while total < size:
+        items.append(item.format(i))
+        total += len(items[-1])
+        i += 1
+    return "items:\n" + "".join("  " + line + "\n" for item in items for line in item.splitlines())
+
+
+def synthetic_xml(size):
+    item = '<item id="{0}"><name>Item {0}</name><price currency="EUR">{0}.99</price><tags><tag>a</tag></tags></item>'
+    items = []
+    total = 0
+    i = 0
+    while total < size:
+        items.append(item.format(i))
+        total += len(items[-1])
+        i += 1
+    return "<items>" + "".join(items) + "</items>"
+
+
+class NullWriter:
+    """ File object discarding the data, so that only the formatting is measured. """
+
+    def write(self, data):
+        return len(data)
+
+
+def bench_formatters(folder, args):
+    documents = (
+        ("json", synthetic_json, formatters.format_json_str, formatters.format_json_stream),
+        ("xml", synthetic_xml, formatters.format_xml_str, formatters.format_xml_stream),
+        ("yaml", synthetic_yaml, formatters.format_yaml_str, formatters.format_yaml_stream),
+    )
+    for extension, generate, format_str, format_stream in documents:
+        size = 10 * 1024
+        while size <= args.max_size:
+            content = generate(size)
+            filepath = os.path.join(folder, f"document.{extension}")
+            with open(filepath, 'w') as f:
+                f.write(content)
+            nbytes = os.path.getsize(filepath)
+            repeat = args.repeat if size < 2**20 else 1
+            # Formatters used by the add_* methods below the preview limit
+            seconds = common.measure(lambda: format_str(content, 4), repeat)
+            yield f"format_{extension}_str ({size // 1024} KB)", seconds, 1, nbytes
+            modified = [0]
+
+            def format_modified_file():
+                # A new modification time for each call, so that the memo is missed
+                modified[0] += 1
+                os.utime(filepath, ns=(modified[0], modified[0]))
+                return formatters.format_file(filepath, 4, extension, format_str)
+            seconds = common.measure(format_modified_file, repeat)
+            yield f"format_file {extension} ({size // 1024} KB)", seconds, 1, nbytes
+            if len(format_modified_file()) <= formatters.MEMO_MAX_LENGTH:
+                seconds = common.measure(lambda: formatters.format_file(filepath, 4, extension, format_str), repeat)
+                yield f"format_file {extension} ({size // 1024} KB, memoized)", seconds, 1, nbytes
+            # Formatters used above the preview limit
+            seconds = common.measure(lambda: format_stream(filepath, NullWriter(), 4), repeat)
+            yield f"format_{extension}_stream ({size // 1024} KB)", seconds, 1, nbytes
+            size *= 10
+
+
+def bench_add_file(folder, args):
+    report = Extras(folder, "all", True, True, False)
+    documents = (
+        ("json", synthetic_json, report.add_json_file, report.add_json_str),
+        ("yaml", synthetic_yaml, report.add_yaml_file, report.add_yaml_str),
+    )
+    count = 20
+    for extension, generate, add_file, add_str in documents:
+        content = generate(100 * 1024)
+        filepath = os.path.join(folder, f"fixture.{extension}")
+        with open(filepath, 'w') as f:
+            f.write(content)
+        # The same fixture file added in several tests
+        seconds = common.measure(lambda: [add_file(None, filepath, NullWriter()) for _ in range(count)], args.repeat)
+        yield f"add_{extension}_file (100 KB, {count} times)", seconds, count, count * len(content)
+        seconds = common.measure(lambda: [add_str(None, content, NullWriter()) for _ in range(count)], args.repeat)
+        yield f"add_{extension}_str (100 KB, {count} times)", seconds, count, count * len(content)
+
+
+BENCHMARKS = [
+    bench_save_screenshot,
+    bench_screenshot,
+    bench_save_files,
+    bench_makereport,
+    bench_session,
+    bench_similarity,
+    bench_create_assets,
+    bench_formatters,
+    bench_add_file,
+]
+
+
+#
+# Results
+#
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the ratio between the current and baseline times of each benchmark.
+
+    Returns:
+        bool: Whether a benchmark is slower than the baseline by more than the threshold.
+    """
+    print(f"\nComparison against {baseline.get('commit')} (threshold {threshold:.2f}x)")
+    regression = False
+    for name, result in results.items():
+        if name not in baseline["results"]:
+            continue
+        ratio = result["seconds"] / baseline["results"][name]["seconds"]
+        status = ""
+        if ratio > threshold:
+            status = "REGRESSION"
+            regression = True
+        elif ratio < 1 / threshold:
+            status = "improvement"
+        print(f"{name:<48} {ratio:8.2f}x {status}")
+    return regression
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="Smaller inputs and fewer repetitions")
+    parser.add_argument("--filter", default=None, help="Only run the benchmark functions whose name contains this text, e.g. formatters")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Compare the results against this JSON file")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+    args.repeat = 3 if args.quick else 5
+    args.steps = 20 if args.quick else 100
+    args.files = 200 if args.quick else 2000
+    args.tests = 200 if args.quick else 1000
+    args.width, args.height = 1280, 2000
+    args.source_size = 200 * 1024
+    args.max_size = 2**20 if args.quick else 10 * 2**20
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        utils.create_assets(folder)
+        for benchmark in BENCHMARKS:
+            if args.filter is not None and args.filter not in benchmark.__name__:
+                continue
+            for name, seconds, count, nbytes in benchmark(folder, args):
+                common.show(name, seconds, count, nbytes)
+                results[name] = {"seconds": seconds, "count": count, "bytes": nbytes}
+
+    data = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=4)
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("quick") != args.quick:
+            print("Warning: the baseline was run with different input sizes", file=sys.stderr)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import collections
+import importlib.util
+
+
+#
+# Registry of screenshot backends.
+# A backend adapts a class of screenshot targets (webdriver, page, element, ...) to the plugin.
+# The backend of each target class is resolved once and cached.
+#
+Backend = collections.namedtuple("Backend", ["name", "screenshot", "source", "owner"], defaults=(None,))
+Backend.__doc__ = """
+Screenshot backend.
+
+Attributes:
+    name (str): The name of the backend.
+    screenshot (function): Takes a screenshot. Called as screenshot(extras, target, full_page) and returns
+                           the screenshot as bytes or base64 string.
+    source (function): Returns the webpage source of a target. None if the target has no webpage source.
+    owner (function): Returns the object, usually the webdriver, whose captures must not run concurrently.
+                      None if the targets can only be captured in the thread using them.
+"""
+
+_registry = {}
+_cache = {}
+_installed = {}
+_builtins_loaded = False
+
+
+def is_installed(module):
+    """ Whether a module is installed. The result is cached. """
+    if module not in _installed:
+        _installed[module] = importlib.util.find_spec(module) is not None
+    return _installed[module]
+
+
+def register(cls, screenshot, source=None, name=None, owner=None):
+    """
+    Registers the backend of a class of screenshot targets, including its subclasses.
+
+    Args:
+        cls (type): The class of the targets.
+        screenshot (function): Called as screenshot(extras, target, full_page).
+                               Returns the screenshot as bytes or base64 string.
+        source (function): Called as source(target). Returns the webpage source.
+                           None if the targets have no webpage source.
+        name (str): The name of the backend. Defaults to the qualified name of the class.
+        owner (function): Called as owner(target). Returns the object, usually the webdriver,
+                          whose captures must not run concurrently.
+                          None if the targets can only be captured in the thread using them.
+    """
+    if name is None:
+        name = f"{cls.__module__}.{cls.__qualname__}"
+    _registry[cls] = Backend(name, screenshot, source, owner)
+    _cache.clear()
+
+
+def resolve(target):
+    """
+    Returns the backend of a screenshot target, looked up through the class hierarchy of the target.
+    None if no backend is registered for the target.
+    """
+    cls = type(target)
+    try:
+        return _cache[cls]
+    except KeyError:
+        pass
+    _load_builtins()
+    backend = None
+    for klass in cls.__mro__:
+        if klass in _registry:
+            backend = _registry[klass]
+            break
+    _cache[cls] = backend
+    return backend
+
+
+#
+# Built-in backends
+#
+def _selenium_element_screenshot(extras, target, full_page):
+    return target.screenshot_as_png
+
+
+def _selenium_driver_screenshot(extras, target, full_page):
+    return target.get_screenshot_as_png()
+
+
+def _selenium_firefox_screenshot(extras, target, full_page):
+    if full_page:
+        return target.get_full_page_screenshot_as_png()
+    return target.get_screenshot_as_png()
+
+
+def _selenium_chromium_screenshot(extras, target, full_page):
+    if full_page:
+        try:
+            return extras._get_full_page_screenshot_chromium(target)
+        except:
+            pass
+    return target.get_screenshot_as_png()
+
+
+def _selenium_driver_source(target):
+    return target.page_source
+
+
+def _selenium_element_owner(target):
+    return target.parent
+
+
+def _selenium_driver_owner(target):
+    return target
+
+
+def _playwright_page_screenshot(extras, target, full_page):
+    return target.screenshot(full_page=full_page, **extras._get_playwright_options())
+
+
+def _playwright_locator_screenshot(extras, target, full_page):
+    return target.screenshot(**extras._get_playwright_options())
+
+
+def _playwright_page_source(target):
+    return target.content()
+
+
+# Fallbacks for the targets of screenshot_selenium and screenshot_playwright methods not registered
+selenium_driver = Backend("selenium", _selenium_driver_screenshot, _selenium_driver_source, _selenium_driver_owner)
+playwright_locator = Backend("playwright.locator", _playwright_locator_screenshot, None)
+
+
+def _load_builtins():
+    """ Registers the backends of the installed webtest libraries. """
+    global _builtins_loaded
+    if _builtins_loaded:
+        return
+    _builtins_loaded = True
+    if is_installed('selenium'):
+        from selenium.webdriver.chromium.webdriver import ChromiumDriver
+        from selenium.webdriver.firefox.webdriver import WebDriver as WebDriver_Firefox
+        from selenium.webdriver.remote.webdriver import WebDriver as WebDriver_Remote
+        from selenium.webdriver.remote.webelement import WebElement
+        _registry.setdefault(WebElement, Backend(
+            "selenium.element", _selenium_element_screenshot, None, _selenium_element_owner))
+        _registry.setdefault(WebDriver_Remote, selenium_driver)
+        _registry.setdefault(ChromiumDriver, Backend(
+            "selenium.chromium", _selenium_chromium_screenshot, _selenium_driver_source, _selenium_driver_owner))
+        _registry.setdefault(WebDriver_Firefox, Backend(
+            "selenium.firefox", _selenium_firefox_screenshot, _selenium_driver_source, _selenium_driver_owner))
+    if is_installed('playwright'):
+        from playwright.sync_api import Locator, Page
+        _registry.setdefault(Page, Backend("playwright.page", _playwright_page_screenshot, _playwright_page_source))
+        _registry.setdefault(Locator, playwright_locator)
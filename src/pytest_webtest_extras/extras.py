@@ -1,19 +1,23 @@
+import asyncio
 import base64
+import collections
+import concurrent.futures
 import html
-import importlib
-import json
-import re
+import os
 import sys
+import threading
+import time
+import traceback
 import warnings
 import xml.parsers.expat as expat
-import xml.dom.minidom as xdom
-import yaml
 from typing import Union
-from . import utils
+from . import backends, formatters, sources as source_storage, utils
 
 
 # Counter used for image and page source files naming
 count = 0
+# Number of characters of the documents written in the payloads folder printed when there is no preview limit
+PREVIEW_SIZE = 1024
 
 
 def counter():
@@ -23,28 +27,119 @@ def counter():
     return count
 
 
+def new_timing(comment=None, capture=0.0):
+    """
+    Returns the timing record of a screenshot, with the time in seconds spent in each phase:
+    capture by the webdriver, decoding of base64 screenshots, writing of the files and Allure attachment.
+    The write time of the files written in the background is the time spent to schedule the write operations.
+    """
+    return {
+        "comment": "" if comment is None else str(comment),
+        "step": None,
+        "capture": capture,
+        "decode": 0.0,
+        "write": 0.0,
+        "allure": 0.0,
+    }
+
+
 class Extras:
     """
     Class to hold pytest-html 'extras' to be added for each test in the HTML report.
     """
 
-    def __init__(self, report_folder, fx_screenshots, fx_comments, fx_sources, report_allure):
+    def __init__(self, report_folder, fx_screenshots, fx_comments, fx_sources, report_allure,
+                 writer=None, store=None, namespace=None, buffer_size=10, thumbnails=False,
+                 image_format="png", image_quality=None, preview_limit=0,
+                 allure_only=False, tiling=None, async_writes=None, pack=None, similarity=0.0,
+                 source_compression=None, write_payloads=False):
         """
         Args:
             report_folder (str): The 'report_folder' fixture.
-            fx_screenshots (str): The 'screenshots' fixture.
+            fx_screenshots (str): The 'screenshots' fixture: all, last, on-failure, none, every:N, interval:T or ring:K.
             fx_comments (bool): The 'comments' fixture.
             fx_sources (bool): The 'sources' fixture.
             report_allure (bool): Whether the allure-pytest plugin is being used.
+            writer (Writer): The 'writer' fixture. The background writer of the files.
+            store (dict): The 'store' fixture. None if identical files are not deduplicated.
+            namespace (str): The 'namespace' fixture. Prefix of the file names, used to avoid
+                             collisions between pytest-xdist workers.
+            buffer_size (int): The 'buffer_size' fixture. The maximum number of screenshots
+                               kept in memory in 'on-failure' mode.
+            thumbnails (bool): The 'thumbnails' fixture. Whether to write a preview of each screenshot.
+            image_format (str): The 'image_format' fixture. The file format of the screenshots.
+            image_quality (int): The 'image_quality' fixture. The quality of JPEG and WebP screenshots.
+            preview_limit (int): The 'preview_limit' fixture. The maximum size of the documents
+                                 added by the add_*_file methods to be printed in full. 0 for no limit.
+            allure_only (bool): The 'allure_only' fixture. Whether to attach the screenshots and webpage sources
+                                to the Allure report only, without writing them for the pytest-html report.
+            tiling (dict): The 'tiling' fixture. The 'tile_height', 'max_height' and 'timeout' budgets
+                           of Chromium full-page screenshots.
+            async_writes (bool): The 'async_writes' fixture. Whether the screenshots taken by the synchronous API
+                                 are written in the background. Defaults to True if a writer is provided.
+                                 The screenshots taken by the asynchronous API are always written in the background.
+            pack (Pack): The 'pack' fixture. The pack file to append the screenshots and webpage sources to,
+                         instead of writing them one by one. None to write them as separate files.
+            similarity (float): The 'similarity' fixture. The difference (0-1) below which a screenshot is considered
+                                the same as the previous one and not written. 0 to write all the screenshots.
+            source_compression (dict): The 'source_compression' fixture. The 'compression' of the webpage sources
+                                       (None, 'gzip' or 'delta') and the number of steps between full 'snapshot's
+                                       in 'delta' compression.
+            write_payloads (bool): The 'write_payloads' fixture. Whether to write the documents added by
+                                   the add_* methods in the payloads folder, printing only their beginning.
         """
         self.images = []
         self.sources = []
         self.comments = []
+        self.thumbnails = []
+        self.payloads = []
+        self.timings = []
+        # Sizes and hashes of the screenshot and webpage source files written for each step:
+        # {'image': {'size', 'hash'}, 'source': {'size', 'hash'}}, or a list of them for grouped steps.
+        # The values of the files written in the background are set once written.
+        self.artifacts = []
         self._fx_screenshots = fx_screenshots
+        # Sampling of the screenshots: mode and its parameter
+        self._mode, self._sampling = utils.get_screenshots_policy(fx_screenshots) or ("all", None)
+        # Number of steps and time of the last screenshot taken, in 'every' and 'interval' modes
+        self._steps = 0
+        self._last_capture = None
         self._fx_comments = fx_comments
         self._fx_sources = fx_sources
         self._folder = report_folder
         self._allure = report_allure
+        self._allure_only = report_allure and allure_only
+        self._writer = writer
+        self._async_writes = writer is not None if async_writes is None else async_writes
+        self._store = store
+        self._pack = pack
+        self._similarity = similarity
+        # Signature and step of the last written screenshot, and steps reusing the screenshot of a previous step
+        self._signature = None
+        self._last_image = None
+        self._same = []
+        self._source_compression = source_compression or {'compression': None, 'snapshot': 1}
+        # Link, content and number of deltas since the last full snapshot of the last webpage source of the test
+        self._base = None
+        self._namespace = namespace
+        self._thumbnails = thumbnails
+        self._image_format = image_format
+        self._image_quality = image_quality
+        self._preview_limit = preview_limit
+        self._write_payloads = write_payloads
+        self._tiling = tiling if tiling is not None else {'tile_height': 0, 'max_height': 0, 'timeout': 0}
+        self._pending = []
+        self._lock = threading.Lock()
+        # Screenshots waiting to be attached to the Allure report: (position in the lists, comment, timing)
+        self._attachments = []
+        # Screenshots waiting to be persisted by the 'flush' method in 'last', 'ring' and 'on-failure' modes
+        if self._mode == 'last':
+            maxlen = 1
+        elif self._mode == 'ring':
+            maxlen = self._sampling
+        else:
+            maxlen = max(1, buffer_size)
+        self._buffer = collections.deque(maxlen=maxlen)
 
 
     def save_screenshot(self, image: Union[bytes, str], comment=None, source=None, escape_html=True):
@@ -54,39 +149,351 @@ class Extras:
         The webpage source is saved in <forder_report>/sources folder.
         Adds the screenshot and source to Allure report, if applicable.
 
+        In 'last', 'ring' and 'on-failure' modes, the screenshot is kept in memory
+        and persisted at report generation time, if applicable.
+        In 'every' and 'interval' modes, the steps not sampled are skipped.
+
         Args:
             image (bytes | str): The screenshot as bytes or base64 string.
             comment (str): The comment of the screenshot.
             source (str): The webpage source code.
             escape_html (bool): Whether to escape HTML characters in the comment.
         """
+        if self._skip():
+            return
+        self._record(image, comment, source, escape_html, self._async_writes)
+
+
+    def _skip(self):
+        """
+        Whether to skip a step in 'every' and 'interval' modes.
+        Called before the screenshot is taken, so that the webdriver is not used for the skipped steps.
+        """
+        if self._mode == 'every':
+            self._steps += 1
+            return (self._steps - 1) % self._sampling != 0
+        if self._mode == 'interval':
+            now = time.monotonic()
+            if self._last_capture is not None and now - self._last_capture < self._sampling:
+                return True
+            self._last_capture = now
+        return False
+
+
+    def _record(self, image, comment, source, escape_html, background, timing=None):
+        """
+        Persists a screenshot and webpage source, or keeps them in memory in 'last', 'ring' and 'on-failure' modes.
+
+        Args:
+            background (bool): Whether to write the files in the background.
+            timing (dict): The timing record of the screenshot, holding its capture time.
+        """
         if self._fx_screenshots == 'none':
             return
-        index = counter()
-        if isinstance(image, str):
-            try:
-                image = base64.b64decode(image.encode())
-            except:
-                image = None
-        link_image = utils.save_image(self._folder, index, image)
-        self.images.append(link_image)
-        link_source = None
-        if source is not None:
-            link_source = utils.save_source(self._folder, index, source)
-        self.sources.append(link_source)
+        if timing is None:
+            timing = new_timing(comment)
+        # The screenshots of the asynchronous API are recorded from the threads of the event loop executor.
+        with self._lock:
+            if self._mode in ('last', 'ring', 'on-failure'):
+                self._buffer.append((image, comment, source, escape_html, timing))
+                return
+            self._save_screenshot(image, comment, source, escape_html, background, timing)
+
+
+    def _save_screenshot(self, image, comment, source, escape_html, background=False, timing=None):
+        """
+        Persists a screenshot and webpage source and records them in the 'extras' lists.
+        The screenshots and webpage sources of a grouped step are given as lists.
+        The time spent in each phase is added to the timing record of the screenshot.
+        """
+        background = background and self._writer is not None
+        if timing is None:
+            timing = new_timing(comment)
+        self.timings.append(timing)
+        group = isinstance(image, list)
+        images = image if group else [image]
+        sources = source if group else [source]
+        start = time.perf_counter()
+        images = [self._decode(image) for image in images]
+        timing["decode"] += time.perf_counter() - start
         if self._fx_comments:
             comment = "" if comment is None else comment
             comment = html.escape(comment, quote=True) if escape_html else comment
+
+        # In Allure only mode, the screenshot and source are only written by allure-pytest plugin.
+        if self._allure_only:
+            start = time.perf_counter()
+            for i in range(len(images)):
+                self._attach_data(images[i], comment, sources[i])
+            timing["allure"] += time.perf_counter() - start
+            return
+
+        same = not group and self._is_same_as_previous(images[0], timing)
+        start = time.perf_counter()
+        if group:
+            # The screenshots of a grouped step are not compared with the next steps.
+            self._signature = None
+            self._last_image = None
+            links_image, links_thumbnail, links_source = [], [], []
+            artifacts = [
+                self._write_files(background, images[i], sources[i], links_image, links_thumbnail, links_source)
+                for i in range(len(images))
+            ]
+            self.images.append(links_image)
+            self.thumbnails.append(links_thumbnail)
+            self.sources.append(links_source)
+            self.artifacts.append(artifacts)
+        elif same:
+            # The screenshot links of the previous step are set by the 'flush' method.
+            self._same.append((len(self.images), self._last_image))
+            self.images.append(self.images[self._last_image])
+            self.thumbnails.append(self.thumbnails[self._last_image])
+            artifacts = {"image": self.artifacts[self._last_image]["image"], "source": None}
+            if sources[0] is not None:
+                artifacts["source"] = self._persist_source(background, self.sources, self._next_index(), sources[0])
+            else:
+                self.sources.append(None)
+            self.artifacts.append(artifacts)
+        else:
+            self.artifacts.append(
+                self._write_files(background, images[0], sources[0], self.images, self.thumbnails, self.sources)
+            )
+            if self._signature is not None and self.images[-1] != f"screenshots{os.sep}error.png":
+                self._last_image = len(self.images) - 1
+            else:
+                # Screenshots that could not be decoded or written are not used for the comparison.
+                self._signature = None
+                self._last_image = None
         self.comments.append(comment)
+        timing["write"] += time.perf_counter() - start
+        timing["step"] = len(self.images) - 1
 
         # Add extras to Allure report if allure-pytest plugin is being used.
-        # if importlib.util.find_spec('allure') is not None:
+        # The files already written are attached, once the background write operations are over.
         if self._allure:
-            import allure
-            allure.attach(image, name=comment, attachment_type=allure.attachment_type.PNG)
-            # Attach the webpage source
-            if source is not None:
-                allure.attach(source, name="page source", attachment_type=allure.attachment_type.TEXT)
+            self._attachments.append((len(self.images) - 1, comment, timing))
+            if not background:
+                self._attach_files()
+
+
+    def _is_same_as_previous(self, image, timing):
+        """
+        Whether a screenshot is almost identical to the last written screenshot of the test.
+        The screenshot is compared with the last written one rather than with the previous step,
+        so that slow changes are not lost.
+        """
+        if self._similarity <= 0:
+            return False
+        signature = None
+        if isinstance(image, bytes):
+            start = time.perf_counter()
+            signature = utils.get_signature(image)
+            timing["decode"] += time.perf_counter() - start
+        if (
+            self._last_image is not None and
+            utils.get_difference(signature, self._signature) < self._similarity
+        ):
+            return True
+        self._signature = signature
+        return False
+
+
+    def _decode(self, image):
+        """ Decodes a screenshot given as base64 string. """
+        if isinstance(image, str):
+            try:
+                image = base64.b64decode(image.encode())
+            except:
+                image = None
+        return image
+
+
+    def _write_files(self, background, image, source, images, thumbnails, sources):
+        """
+        Writes the files of a screenshot and webpage source and appends their links to the given lists.
+
+        Returns:
+            dict: The sizes and hashes of the written screenshot and webpage source files (see 'artifacts').
+        """
+        # The screenshot is hashed once for the deduplication of the screenshot and its preview.
+        digest = utils.get_digest(image) if self._store is not None and isinstance(image, bytes) else None
+        index = self._next_index()
+        image_stored = self._persist(
+            background, images, utils.get_image_link(index, self._image_format),
+            utils.save_image, index, image, self._image_format, self._image_quality, digest=digest, stored=True)
+        if self._thumbnails:
+            self._persist(background, thumbnails, utils.get_thumbnail_link(index),
+                          utils.save_thumbnail, index, image, digest=digest)
+        else:
+            thumbnails.append(None)
+        source_stored = None
+        if source is not None:
+            source_stored = self._persist_source(background, sources, index, source)
+        else:
+            sources.append(None)
+        return {"image": image_stored, "source": source_stored}
+
+
+    def _persist_source(self, background, links, index, source):
+        """
+        Writes a webpage source file, compressed if configured, and appends its link to a list.
+        In 'delta' compression, the webpage source is written as the difference with the previous one of the test,
+        with a full snapshot every few steps.
+
+        Returns:
+            dict: The size and hash of the written file (see '_persist').
+        """
+        compression = self._source_compression['compression']
+        base = None
+        if (
+            compression == 'delta' and self._base is not None and
+            self._base[2] + 1 < self._source_compression['snapshot']
+        ):
+            base = self._base[:2]
+        link = utils.get_source_link(index)
+        stored = self._persist(background, links, link, utils.save_source, index, source, compression, base,
+                               stored=True)
+        if compression == 'delta':
+            # Deduplicated or failed webpage sources are not used as base: the next one is a full snapshot.
+            self._base = (link, source, 0 if base is None else self._base[2] + 1) if links[-1] == link else None
+        return stored
+
+
+    def _read_source(self, link):
+        """ Returns a compressed webpage source, decompressed or rebuilt from the previous ones. """
+        def read_file(key):
+            if self._pack is not None:
+                try:
+                    return self._pack.read(key)
+                except KeyError:
+                    return None
+            try:
+                with open(utils.get_path(self._folder, key.replace('/', os.sep)), 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+        return source_storage.read(link.replace(os.sep, '/'), read_file)
+
+
+    def _attach_data(self, image, comment, source):
+        """ Attaches a screenshot and webpage source to the Allure report. """
+        import allure
+        if image is not None:
+            attachment_type, extension = utils.get_allure_attachment_type(utils.get_image_format(image))
+            allure.attach(image, name=comment, attachment_type=attachment_type, extension=extension)
+        # Attach the webpage source
+        if source is not None:
+            allure.attach(source, name="page source", attachment_type=allure.attachment_type.TEXT)
+
+
+    def _attach_files(self):
+        """ Attaches the written screenshots and webpage sources to the Allure report. """
+        import allure
+        for position, comment, timing in self._attachments:
+            start = time.perf_counter()
+            images = self.images[position]
+            sources = self.sources[position]
+            if not isinstance(images, list):
+                images = [images]
+                sources = [sources]
+            for image, source in zip(images, sources):
+                attachment_type, extension = utils.get_allure_attachment_type(utils.get_image_format_from_link(image))
+                if self._pack is not None and image != f"screenshots{os.sep}error.png":
+                    allure.attach(self._pack.read(image), name=comment,
+                                  attachment_type=attachment_type, extension=extension)
+                else:
+                    allure.attach.file(utils.get_path(self._folder, image), name=comment,
+                                       attachment_type=attachment_type, extension=extension)
+                # Attach the webpage source
+                if source is not None and self._source_compression['compression'] is not None:
+                    allure.attach(self._read_source(source), name="page source",
+                                  attachment_type=allure.attachment_type.TEXT)
+                elif source is not None and self._pack is not None:
+                    allure.attach(self._pack.read(source), name="page source",
+                                  attachment_type=allure.attachment_type.TEXT)
+                elif source is not None:
+                    allure.attach.file(utils.get_path(self._folder, source), name="page source",
+                                       attachment_type=allure.attachment_type.TEXT)
+            timing["allure"] += time.perf_counter() - start
+        self._attachments.clear()
+
+
+    def _next_index(self):
+        """ Returns the suffix of the next file name. """
+        return counter() if self._namespace is None else f"{self._namespace}-{counter()}"
+
+
+    def _persist(self, background, links, link, func, index, data, *args, digest=None, stored=False):
+        """
+        Writes a screenshot or webpage source file and appends its link to a list.
+        If written in the background, the link is updated by the 'flush' method.
+        If a store is available, files whose content has already been written
+        during the session are not written again and the link of the existing file is used instead.
+
+        Args:
+            background (bool): Whether to write the file with the background writer.
+            links (list): The list of links to append the link to.
+            link (str): The expected link of the file.
+            func (function): The function writing the file.
+            index (int | str): The suffix of the file name.
+            data (bytes | str): The content of the file.
+            args: Additional arguments of the function writing the file.
+            digest (str): The hash of the content of the file, if already computed.
+            stored (bool): Whether the function writing the file records the size and hash of the written content.
+
+        Returns:
+            dict: The 'size' and 'hash' of the written content, set once the file is written.
+                  The ones of the existing file if the file is deduplicated. None if not recorded.
+        """
+        key = None
+        if self._store is not None and isinstance(data, (bytes, str)):
+            key = (func.__name__, digest or utils.get_digest(data))
+            if key in self._store:
+                link, future, description = self._store[key]
+                if future is not None:
+                    self._pending.append((links, len(links), future))
+                links.append(link)
+                return description
+        future = None
+        expected = link
+        kwargs = {} if self._pack is None else {'pack': self._pack}
+        description = None
+        if stored:
+            description = {"size": None, "hash": None}
+            kwargs['stored'] = description
+        if not background:
+            link = func(self._folder, index, data, *args, **kwargs)
+        else:
+            future = self._writer.submit(func, self._folder, index, data, *args, **kwargs)
+            self._pending.append((links, len(links), future))
+        links.append(link)
+        if key is not None and link == expected:
+            self._store[key] = (link, future, description)
+        return description
+
+
+    def flush(self, failed=False):
+        """
+        Persists the screenshots kept in memory in 'last' and 'ring' modes, or in 'on-failure' mode if the test failed.
+        Waits for the background write operations of the test
+        and replaces the links of the files that failed to be written.
+
+        Args:
+            failed (bool): Whether the test failed.
+        """
+        if self._mode in ('last', 'ring') or (self._mode == 'on-failure' and failed):
+            for image, comment, source, escape_html, timing in self._buffer:
+                self._save_screenshot(image, comment, source, escape_html, timing=timing)
+        self._buffer.clear()
+        for links, position, future in self._pending:
+            links[position] = future.result()
+        self._pending.clear()
+        for position, previous in self._same:
+            self.images[position] = self.images[previous]
+            self.thumbnails[position] = self.thumbnails[previous]
+        self._same.clear()
+        if len(self._attachments) > 0:
+            self._attach_files()
 
 
     def screenshot_selenium(self, target, comment=None, full_page=True, escape_html=True):
@@ -99,37 +506,128 @@ class Extras:
             full_page (bool): Whether to take a full-page screenshot if the target is a WebDriver instance.
                               Defaults to True.
         """
-        if importlib.util.find_spec('selenium') is not None:
-            from selenium.webdriver.chrome.webdriver import WebDriver as WebDriver_Chrome
-            from selenium.webdriver.chromium.webdriver import ChromiumDriver as WebDriver_Chromium
-            from selenium.webdriver.edge.webdriver import WebDriver as WebDriver_Edge
-            from selenium.webdriver.remote.webelement import WebElement
-        else:
+        if not backends.is_installed('selenium'):
             print("Selenium module is not installed.", file=sys.stderr)
             return
+        if self._fx_screenshots == 'none' or self._skip():
+            return
+        self._capture(target, backends.resolve(target) or backends.selenium_driver, comment, full_page, escape_html)
 
-        source = None
-        if self._fx_screenshots == 'none':
+
+    def screenshot(self, target, comment=None, full_page=True, escape_html=True):
+        """
+        Saves the pytest-html 'extras': screenshot, comment and webpage source,
+        using the backend registered for the target (see 'backends.register').
+
+        Args:
+            target (object): The target of the screenshot.
+            comment (str): The comment for the screenshot to take.
+            full_page (bool): Whether to take a full-page screenshot, if supported by the backend.
+                              Defaults to True.
+            escape_html (bool): Whether to escape HTML characters in the comment.
+        """
+        if self._fx_screenshots == 'none' or self._skip():
             return
-        if isinstance(target, WebElement):
-            image = target.screenshot_as_png
-        else:
-            if full_page is True:
-                if hasattr(target, "get_full_page_screenshot_as_png"):
-                    image = target.get_full_page_screenshot_as_png()
-                else:
-                    if type(target) in (WebDriver_Chrome, WebDriver_Chromium, WebDriver_Edge):
-                        try:
-                            image = utils.get_full_page_screenshot_chromium(target)
-                        except:
-                            image = target.get_screenshot_as_png()
-                    else:
-                        image = target.get_screenshot_as_png()
+        backend = backends.resolve(target)
+        if backend is None:
+            print(f"No screenshot backend registered for {type(target).__name__} targets.", file=sys.stderr)
+            return
+        self._capture(target, backend, comment, full_page, escape_html)
+
+
+    def screenshot_many(self, targets, comment=None, full_page=True, escape_html=True):
+        """
+        Saves the pytest-html 'extras' of several targets as a single step: screenshots, comment and webpage sources.
+        The targets are captured concurrently, with one thread per webdriver.
+        Targets that can't be used from other threads (Playwright) are captured in the calling thread.
+
+        Args:
+            targets (list): The targets of the screenshots, with registered backends (see 'backends.register').
+            comment (str): The comment of the step.
+            full_page (bool): Whether to take full-page screenshots, if supported by the backends.
+                              Defaults to True.
+            escape_html (bool): Whether to escape HTML characters in the comment.
+        """
+        if self._fx_screenshots == 'none' or self._skip():
+            return
+        targets = list(targets)
+        resolved = []
+        for target in targets:
+            backend = backends.resolve(target)
+            if backend is None:
+                print(f"No screenshot backend registered for {type(target).__name__} targets.", file=sys.stderr)
+                return
+            resolved.append(backend)
+
+        # Group the targets by owner: the captures of the same webdriver are sequential.
+        groups = {}
+        local = []
+        for i in range(len(targets)):
+            owner = resolved[i].owner(targets[i]) if resolved[i].owner is not None else None
+            if owner is None:
+                local.append(i)
             else:
-                image = target.get_screenshot_as_png()
-            if self._fx_sources:
-                source = target.page_source
-        self.save_screenshot(image, comment, source, escape_html)
+                groups.setdefault(id(owner), []).append(i)
+
+        results = [(None, None)] * len(targets)
+        start = time.perf_counter()
+
+        def capture(positions):
+            for i in positions:
+                results[i] = self._capture_target(targets[i], resolved[i], full_page)
+
+        if len(groups) > 0:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(groups)) as pool:
+                futures = [pool.submit(capture, positions) for positions in groups.values()]
+                capture(local)
+                # Raise the errors of the capture threads
+                for future in futures:
+                    future.result()
+        else:
+            capture(local)
+        timing = new_timing(comment, time.perf_counter() - start)
+        self._record([image for image, _ in results], comment, [source for _, source in results],
+                     escape_html, self._async_writes, timing)
+
+
+    def _capture_target(self, target, backend, full_page):
+        """
+        Takes the screenshot and webpage source of a target through its backend.
+        The screenshot is None if it could not be taken, the webpage source is None if it could not be read.
+
+        Returns:
+            tuple: The screenshot and webpage source.
+        """
+        image = None
+        try:
+            image = backend.screenshot(self, target, full_page)
+            source = None
+            if self._fx_sources and backend.source is not None:
+                source = backend.source(target)
+            return image, source
+        except Exception as e:
+            trace = traceback.format_exc()
+            print(f"{str(e)}\n\n{trace}", file=sys.stderr)
+            return image, None
+
+
+    def _capture(self, target, backend, comment, full_page, escape_html):
+        """ Takes the screenshot and webpage source of a target through its backend. """
+        start = time.perf_counter()
+        image = backend.screenshot(self, target, full_page)
+        source = None
+        if self._fx_sources and backend.source is not None:
+            source = backend.source(target)
+        timing = new_timing(comment, time.perf_counter() - start)
+        self._record(image, comment, source, escape_html, self._async_writes, timing)
+
+
+    def _get_full_page_screenshot_chromium(self, driver):
+        """ Takes a full-page screenshot of a Chromium based webdriver, by tiles if configured. """
+        if self._tiling['tile_height'] > 0 and backends.is_installed('PIL'):
+            return utils.get_full_page_screenshot_chromium_tiled(driver, **self._tiling)
+        return utils.get_full_page_screenshot_chromium(
+            driver, self._image_format, self._image_quality, self._tiling['max_height'])
 
 
     def screenshot_playwright(self, target, comment=None, full_page=True, escape_html=True):
@@ -142,22 +640,101 @@ class Extras:
             full_page (bool): Whether to take a full-page screenshot if the target is a Page instance.
                               Defaults to True.
         """
-        if importlib.util.find_spec('playwright') is not None:
-            from playwright.sync_api import Page
-        else:
+        if not backends.is_installed('playwright'):
             print("Playwright module is not installed.", file=sys.stderr)
             return
+        if self._fx_screenshots == 'none' or self._skip():
+            return
+        self._capture(target, backends.resolve(target) or backends.playwright_locator, comment, full_page, escape_html)
 
-        source = None
+
+    async def screenshot_playwright_async(self, target, comment=None, full_page=True, escape_html=True):
+        """
+        Saves the pytest-html 'extras': screenshot, comment and webpage source,
+        for the Playwright asynchronous API.
+        The screenshot and webpage source are taken concurrently and written in the background.
+
+        Args:
+            target (Page | Locator): The target of the screenshot (playwright.async_api).
+            comment (str): The comment for the screenshot to take.
+            full_page (bool): Whether to take a full-page screenshot if the target is a Page instance.
+                              Defaults to True.
+            escape_html (bool): Whether to escape HTML characters in the comment.
+        """
+        if not backends.is_installed('playwright'):
+            print("Playwright module is not installed.", file=sys.stderr)
+            return
+        if self._fx_screenshots == 'none' or self._skip():
+            return
+        start = time.perf_counter()
+        image, source = await self._capture_playwright_async(target, full_page)
+        await self._record_async(image, comment, source, escape_html, new_timing(comment, time.perf_counter() - start))
+
+
+    async def screenshot_playwright_gather(self, targets, comments=None, full_page=True, escape_html=True):
+        """
+        Saves the pytest-html 'extras' of several pages or locators, taken concurrently,
+        for the Playwright asynchronous API.
+        The steps are recorded in the order of the targets.
+
+        Args:
+            targets (list[Page | Locator]): The targets of the screenshots (playwright.async_api).
+            comments (list[str]): The comments for the screenshots to take, in the order of the targets.
+            full_page (bool): Whether to take full-page screenshots of the Page instances.
+                              Defaults to True.
+            escape_html (bool): Whether to escape HTML characters in the comments.
+        """
+        if not backends.is_installed('playwright'):
+            print("Playwright module is not installed.", file=sys.stderr)
+            return
         if self._fx_screenshots == 'none':
             return
-        if isinstance(target, Page):
-            image = target.screenshot(full_page=full_page)
-            if self._fx_sources:
-                source = target.content()
-        else:
-            image = target.screenshot()
-        self.save_screenshot(image, comment, source, escape_html)
+        targets = list(targets)
+        comments = [None] * len(targets) if comments is None else list(comments)
+        # Each target is a step: the steps not sampled are not captured.
+        sampled = [i for i in range(len(targets)) if not self._skip()]
+        targets = [targets[i] for i in sampled]
+        comments = [comments[i] if i < len(comments) else None for i in sampled]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self._capture_playwright_async(target, full_page) for target in targets))
+        # The captures run concurrently: each one is given the elapsed time of the whole batch.
+        elapsed = time.perf_counter() - start
+        for (image, source), comment in zip(results, comments):
+            await self._record_async(image, comment, source, escape_html, new_timing(comment, elapsed))
+
+
+    async def _record_async(self, image, comment, source, escape_html, timing):
+        """
+        Records a screenshot taken by the Playwright asynchronous API in the background.
+        The decoding, hashing and scheduling of the write operations run in the default executor of the event loop,
+        so that they don't block the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._record, image, comment, source, escape_html, True, timing)
+
+
+    async def _capture_playwright_async(self, target, full_page):
+        """
+        Takes the screenshot and webpage source of a Playwright asynchronous target concurrently.
+
+        Returns:
+            tuple: The screenshot and webpage source.
+        """
+        from playwright.async_api import Page
+        options = self._get_playwright_options()
+        if not isinstance(target, Page):
+            return await target.screenshot(**options), None
+        if not self._fx_sources:
+            return await target.screenshot(full_page=full_page, **options), None
+        image, source = await asyncio.gather(target.screenshot(full_page=full_page, **options), target.content())
+        return image, source
+
+
+    def _get_playwright_options(self):
+        """ Playwright encodes JPEG natively. Other formats are converted when saved. """
+        if self._image_format == "jpeg":
+            return {'type': "jpeg", 'quality': self._image_quality}
+        return {}
 
 
     def screenshot_for_selenium(self, target, comment=None, full_page=True, escape_html=True):
@@ -176,32 +753,117 @@ class Extras:
         self.screenshot_playwright(target, comment, full_page, escape_html)
 
 
+    def _add_file(self, description, filepath, file, indent, extension, format_file, format_stream):
+        """
+        Adds the content of a file to the report.
+        If the file is larger than the preview limit, the formatted document is written incrementally
+        in <forder_report>/payloads folder. Only its beginning is printed and a link to it is added to the report.
+        Smaller files are formatted in memory, and written in the same folder if payloads are written.
+
+        Args:
+            extension (str): The extension of the formatted document file.
+            format_file (function): The method formatting the whole file in memory.
+            format_stream (function): The function formatting the file incrementally.
+        """
+        if description is not None:
+            print(description + '\n', file=file)
+        if self._preview_limit <= 0 or os.path.getsize(filepath) <= self._preview_limit:
+            result = format_file(filepath, indent)
+            if not self._write_payloads:
+                print(result, file=file)
+                return
+            self._add_formatted(description if description is not None else os.path.basename(filepath),
+                                extension, result, file)
+            return
+        index = self._next_index()
+        link = utils.save_payload(self._folder, index, extension, format_stream, filepath, indent)
+        if link is None:
+            # The document is not formatted in memory, as it can be large: only its beginning is printed as is.
+            size = self._get_preview_size()
+            content = utils.read_head(filepath, size + 1)
+            print("Raw text:\n" + content[:size], file=file)
+            if len(content) > size:
+                print("\n[...]\n\nTruncated content.\n", file=file)
+            return
+        preview = utils.read_payload(self._folder, link, self._get_preview_size() + 1)
+        self._add_payload(description if description is not None else os.path.basename(filepath), link, preview, file)
+
+
+    def _add_str(self, description, content, file, indent, extension, format_str):
+        """
+        Adds a string holding a document to the report.
+        If payloads are written, the formatted document is written in <forder_report>/payloads folder.
+        Only its beginning is printed and a link to it is added to the report.
+
+        Args:
+            extension (str): The extension of the formatted document file.
+            format_str (function): The method formatting the document.
+        """
+        if description is not None:
+            print(description + '\n', file=file)
+        result = format_str(content, indent)
+        if not self._write_payloads:
+            print(result, file=file)
+            return
+        self._add_formatted(description if description is not None else f"{extension.upper()} document",
+                            extension, result, file)
+
+
+    def _add_formatted(self, description, extension, result, file):
+        """
+        Writes a formatted document in <forder_report>/payloads folder.
+        Only its beginning is printed and a link to it is added to the report.
+        The document is printed in full if it could not be written.
+        """
+        index = self._next_index()
+        link = utils.save_payload(self._folder, index, extension, lambda filepath, dst, indent: dst.write(result), None, 0)
+        if link is None:
+            print(result, file=file)
+            return
+        preview = result[:self._get_preview_size() + 1]
+        self._add_payload(description, link, preview, file)
+
+
+    def _add_payload(self, description, link, preview, file):
+        """
+        Prints the beginning of a document written in the payloads folder and adds a link to it to the report.
+
+        Args:
+            preview (str): The beginning of the document, one character longer than the preview size if truncated.
+        """
+        size = self._get_preview_size()
+        if len(preview) > size:
+            print(preview[:size], file=file)
+            print(f"\n[...]\n\nTruncated content. Full content: {link}\n", file=file)
+        else:
+            print(preview, file=file)
+        self.payloads.append((description, link))
+
+
+    def _get_preview_size(self):
+        """ The number of characters printed of the documents written in the payloads folder. """
+        return self._preview_limit if self._preview_limit > 0 else PREVIEW_SIZE
+
+
     def _format_json_file(self, filepath, indent=4):
         """
         Formats the contents of a JSON file.
         """
-        f = open(filepath, 'r')
-        content = f.read()
-        f.close()
-        return self._format_json_str(content, indent)
+        return formatters.format_file(filepath, indent, "json", self._format_json_str)
 
 
     def _format_json_str(self, content, indent=4):
         """
         Formats a string holding a JSON content.
         """
-        content = json.loads(content)
-        return json.dumps(content, indent=indent) + '\n'
+        return formatters.format_json_str(content, indent)
 
 
     def _format_xml_file(self, filepath, indent=4):
         """
         Formats the contents of a XML file.
         """
-        f = open(filepath, 'r')
-        content = f.read()
-        f.close()
-        return self._format_xml_str(content, indent)
+        return formatters.format_file(filepath, indent, "xml", self._format_xml_str)
 
 
     def _format_xml_str(self, content, indent=4):
@@ -210,8 +872,8 @@ class Extras:
         """
         result = None
         try:
-            result = xdom.parseString(re.sub(r"\n\s+", "",  content).replace('\n','')).toprettyxml(indent=" " * indent)
-        except expat.ExpatError:
+            result = formatters.format_xml_str(content, indent)
+        except (expat.ExpatError, TypeError):
             if content is None:
                 content = 'None'
             result = "Raw text:\n" + content
@@ -222,69 +884,53 @@ class Extras:
         """
         Formats the contents of a YAML file.
         """
-        f = open(filepath, 'r')
-        content = f.read()
-        f.close()
-        return self._format_yaml_str(content, indent)
+        return formatters.format_file(filepath, indent, "yaml", self._format_yaml_str)
 
 
     def _format_yaml_str(self, content, indent=4):
         """
         Formats a string containing a YAML document content.
         """
-        content = yaml.safe_load(content)
-        return yaml.dump(content, indent=indent)
+        return formatters.format_yaml_str(content, indent)
 
 
     def add_xml_file(self, description, filepath, file=sys.stdout, indent=4):
         """
         Adds the content of a XML file to the report.
         """
-        if description is not None:
-            print(description + '\n', file=file)
-        print(self._format_xml_file(filepath, indent), file=file)
+        self._add_file(description, filepath, file, indent, "xml", self._format_xml_file, formatters.format_xml_stream)
 
 
     def add_xml_str(self, description, content, file=sys.stdout, indent=4):
         """
         Adds a string containing a XML document to the report.
         """
-        if description is not None:
-            print(description + '\n', file=file)
-        print(self._format_xml_str(content, indent), file=file)
+        self._add_str(description, content, file, indent, "xml", self._format_xml_str)
 
 
     def add_json_file(self, description, filepath, file=sys.stdout, indent=4):
         """
         Adds the content of an JSON file to the report.
         """
-        if description is not None:
-            print(description + '\n', file=file)
-        print(self._format_json_file(filepath, indent), file=file)
+        self._add_file(description, filepath, file, indent, "json", self._format_json_file, formatters.format_json_stream)
 
 
     def add_json_str(self, description, content, file=sys.stdout, indent=4):
         """
         Adds a string containing a JSON document to the report.
         """
-        if description is not None:
-            print(description + '\n', file=file)
-        print(self._format_json_str(content, indent), file=file)
+        self._add_str(description, content, file, indent, "json", self._format_json_str)
 
 
     def add_yaml_file(self, description, filepath, file=sys.stdout, indent=4):
         """
         Adds the content of a YAML file to the report.
         """
-        if description is not None:
-            print(description + '\n', file=file)
-        print(self._format_yaml_file(filepath, indent), file=file)
+        self._add_file(description, filepath, file, indent, "yaml", self._format_yaml_file, formatters.format_yaml_stream)
 
 
     def add_yaml_str(self, description, content, file=sys.stdout, indent=4):
         """
         Adds a string holding a YAML to the report.
         """
-        if description is not None:
-            print(description + '\n', file=file)
-        print(self._format_yaml_str(content, indent), file=file)
+        self._add_str(description, content, file, indent, "yaml", self._format_yaml_str)
@@ -0,0 +1,570 @@
+import collections
+import io
+import json
+import os
+import re
+import threading
+import xml.parsers.expat as expat
+import yaml
+from xml.sax.saxutils import escape, quoteattr
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The LibYAML bindings are used if PyYAML was built with them.
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+#
+# Streaming pretty-printers.
+# They read the source document by chunks and write the formatted document incrementally,
+# so that the memory usage doesn't depend on the size of the document.
+#
+CHUNK_SIZE = 64 * 1024
+
+# Whitespace and token: string, number or constant, or punctuation.
+# A string cut at the end of a chunk is read as a punctuation, and the rest of it by _json_string.
+_json_token = re.compile(r'[ \t\n\r]*(?:"((?:[^"\\]|\\.)*)"|([^ \t\n\r{}\[\],:"]+)|([^ \t\n\r]))', re.DOTALL)
+_json_string = re.compile(r'(?:[^"\\]|\\.)*', re.DOTALL)
+_json_number = re.compile(r'-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?')
+_json_constants = ("true", "false", "null", "NaN", "Infinity", "-Infinity")
+
+
+class JsonIndenter:
+    """
+    Tokenizer writing an indented JSON document, with the same output as json.dumps.
+    The document is validated token by token, without building its object tree.
+    Strings and numbers are written as json.dumps writes them once parsed by json.loads.
+    """
+
+    # Expected tokens
+    VALUE, KEY, COLON, NEXT, END = range(5)
+
+    def __init__(self, dst, indent=4):
+        """
+        Args:
+            dst (TextIO): The file object to write the formatted document to.
+            indent (int): The indentation width.
+        """
+        self._dst = dst
+        self._indent = indent
+        self._stack = []        # Objects and arrays not closed yet
+        self._expect = JsonIndenter.VALUE
+        self._opened = False    # Whether the last token opened an object or array
+        self._string = None     # Parts of the string cut at the end of the last chunk
+        self._key = False       # Whether the string being read is an object key
+        self._rest = ""         # Number or constant cut at the end of the last chunk
+        self._offset = 0        # Position of the beginning of the last chunk in the document
+
+    def feed(self, chunk, final=False):
+        """
+        Writes the indented tokens of a chunk of the document.
+        A token cut at the end of the chunk is kept until the next chunk.
+
+        Raises:
+            ValueError: If the document is not valid JSON.
+        """
+        data = self._rest + chunk
+        self._offset -= len(self._rest)
+        self._rest = ""
+        pos = 0
+        size = len(data)
+        while pos < size:
+            if self._string is not None:
+                end = _json_string.match(data, pos).end()
+                self._string.append(data[pos:end])
+                pos = end
+                if pos < size:
+                    if data[pos] == '"':
+                        string = "".join(self._string)
+                        self._string = None
+                        self._write_string(string)
+                        pos += 1
+                    else:
+                        # Escape character at the end of the chunk
+                        self._rest = data[pos:]
+                        break
+                continue
+            match = _json_token.match(data, pos)
+            if match is None:
+                # Whitespace up to the end of the chunk
+                break
+            string, scalar, punctuation = match.groups()
+            if string is not None:
+                self._start_string(self._offset + match.start(1) - 1)
+                self._write_string(string)
+            elif scalar is not None:
+                if match.end() == size and not final:
+                    self._rest = scalar
+                    break
+                self._write_scalar(scalar, self._offset + match.start(2))
+            elif punctuation == '"':
+                self._start_string(self._offset + match.start(3))
+                self._string = []
+            else:
+                self._write_punctuation(punctuation, self._offset + match.start(3))
+            pos = match.end()
+        self._offset += size
+
+    def close(self):
+        """
+        Writes the end of the document.
+
+        Raises:
+            ValueError: If the document is not valid JSON.
+        """
+        self.feed("", final=True)
+        if self._string is not None or self._rest != "":
+            raise ValueError(f"Unterminated string at character {self._offset}")
+        if self._expect != JsonIndenter.END:
+            raise ValueError(f"Unexpected end of document at character {self._offset}")
+        self._dst.write('\n')
+
+    def _write_punctuation(self, token, position):
+        expect = self._expect
+        if token in ('}', ']'):
+            if (
+                len(self._stack) == 0 or self._stack[-1] != ('{' if token == '}' else '[') or
+                not (expect == JsonIndenter.NEXT or self._opened)
+            ):
+                self._error(token, position)
+            self._stack.pop()
+            if not self._opened:
+                self._newline()
+            self._dst.write(token)
+            self._opened = False
+            self._end_value()
+        elif token == ',':
+            if expect != JsonIndenter.NEXT:
+                self._error(token, position)
+            self._dst.write(',')
+            self._newline()
+            self._expect = JsonIndenter.KEY if self._stack[-1] == '{' else JsonIndenter.VALUE
+        elif token == ':':
+            if expect != JsonIndenter.COLON:
+                self._error(token, position)
+            self._dst.write(': ')
+            self._expect = JsonIndenter.VALUE
+        elif token in ('{', '[') and expect == JsonIndenter.VALUE:
+            self._start_value()
+            self._dst.write(token)
+            self._stack.append(token)
+            self._opened = True
+            self._expect = JsonIndenter.KEY if token == '{' else JsonIndenter.VALUE
+        else:
+            self._error(token, position)
+
+    def _start_string(self, position):
+        if self._expect not in (JsonIndenter.VALUE, JsonIndenter.KEY):
+            self._error('"', position)
+        self._start_value()
+        self._key = self._expect == JsonIndenter.KEY
+
+    def _write_string(self, string):
+        if string.isascii() and string.isprintable() and '\\' not in string:
+            self._dst.write('"' + string + '"')
+        else:
+            self._dst.write(json.dumps(json.loads('"' + string + '"')))
+        if self._key:
+            self._expect = JsonIndenter.COLON
+        else:
+            self._end_value()
+
+    def _write_scalar(self, token, position):
+        if self._expect != JsonIndenter.VALUE:
+            self._error(token, position)
+        self._start_value()
+        self._dst.write(self._scalar(token, position))
+        self._end_value()
+
+    def _scalar(self, token, position):
+        """ Returns a number or constant as written by json.dumps. """
+        if token.isdigit() and (token[0] != '0' or len(token) == 1):
+            return token
+        if token in _json_constants:
+            return token
+        match = _json_number.fullmatch(token)
+        if match is None:
+            self._error(token, position)
+        if match.group(1) is None and match.group(2) is None:
+            return str(int(token))
+        return json.dumps(float(token))
+
+    def _start_value(self):
+        if self._opened:
+            self._newline()
+            self._opened = False
+
+    def _end_value(self):
+        self._expect = JsonIndenter.NEXT if len(self._stack) > 0 else JsonIndenter.END
+
+    def _newline(self):
+        self._dst.write('\n' + ' ' * (self._indent * len(self._stack)))
+
+    def _error(self, token, position):
+        raise ValueError(f"Unexpected {token!r} at character {position}")
+
+
+def format_json_stream(filepath, dst, indent=4):
+    """
+    Writes the indented contents of a JSON file, with the same output as json.dumps.
+
+    Args:
+        filepath (str): The JSON file.
+        dst (TextIO): The file object to write the formatted document to.
+        indent (int): The indentation width.
+
+    Raises:
+        ValueError: If the document is not valid JSON.
+    """
+    indenter = JsonIndenter(dst, indent)
+    f = open(filepath, 'r')
+    try:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if chunk == "":
+                break
+            indenter.feed(chunk)
+    finally:
+        f.close()
+    indenter.close()
+
+
+def format_yaml_stream(filepath, dst, indent=4):
+    """
+    Writes the indented contents of a YAML file.
+    The document is parsed and re-emitted event by event in block style, without building its object tree.
+    Unlike format_yaml_str, which needs the whole document to sort the mapping keys,
+    the order of the mapping keys and the style of the scalars are preserved.
+
+    Args:
+        filepath (str): The YAML file.
+        dst (TextIO): The file object to write the formatted document to.
+        indent (int): The indentation width.
+
+    Raises:
+        yaml.YAMLError: If the document is not well-formed.
+    """
+    f = open(filepath, 'r')
+    try:
+        yaml.emit(_block_style(yaml.parse(f, Loader=SafeLoader)), stream=dst, indent=indent, Dumper=SafeDumper)
+    finally:
+        f.close()
+
+
+def _block_style(events):
+    """ Sets the block style to the collections of a stream of YAML events. """
+    for event in events:
+        if isinstance(event, yaml.CollectionStartEvent):
+            event.flow_style = False
+        yield event
+
+
+class XmlIndenter:
+    """
+    Expat handlers writing an indented XML document, with the same layout as minidom's toprettyxml.
+    Whitespace-only text between elements is dropped and text mixed with child elements is stripped.
+    Elements holding only text are written in a single line and their text is kept unchanged.
+    """
+
+    def __init__(self, dst, indent=4):
+        """
+        Args:
+            dst (TextIO): The file object to write the formatted document to.
+            indent (int): The indentation width.
+        """
+        self._dst = dst
+        self._indent = ' ' * indent
+        self._depth = 0
+        self._tag = None       # Start tag not written yet, waiting to know the content of the element
+        self._text = []        # Text gathered since the last tag
+        self._cdata = False
+
+    def parser(self):
+        """ Returns an expat parser bound to the handlers. """
+        parser = expat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.characters
+        parser.CommentHandler = self.comment
+        parser.ProcessingInstructionHandler = self.processing_instruction
+        parser.StartCdataSectionHandler = self.start_cdata
+        parser.EndCdataSectionHandler = self.end_cdata
+        return parser
+
+    def start_document(self):
+        self._dst.write('<?xml version="1.0" ?>\n')
+
+    def start_element(self, name, attributes):
+        self._write_pending()
+        attrs = "".join(
+            f" {attributes[i]}={quoteattr(attributes[i + 1])}"
+            for i in range(0, len(attributes), 2)
+        )
+        self._tag = f"<{name}{attrs}"
+
+    def end_element(self, name):
+        text = "".join(self._text)
+        self._text = []
+        if self._tag is not None:
+            # Element without child elements
+            tag = self._tag
+            self._tag = None
+            if text == "":
+                self._line(f"{tag}/>")
+            else:
+                self._line(f"{tag}>{text}</{name}>")
+        else:
+            self._write_text(text)
+            self._depth -= 1
+            self._line(f"</{name}>")
+
+    def characters(self, data):
+        if self._cdata:
+            data = f"<![CDATA[{data}]]>"
+        else:
+            data = escape(data)
+        self._text.append(data)
+
+    def comment(self, data):
+        self._write_pending()
+        self._line(f"<!--{data}-->")
+
+    def processing_instruction(self, target, data):
+        self._write_pending()
+        self._line(f"<?{target} {data}?>")
+
+    def start_cdata(self):
+        self._cdata = True
+
+    def end_cdata(self):
+        self._cdata = False
+
+    def _write_pending(self):
+        """ Writes the pending start tag and text before a child node. """
+        text = "".join(self._text)
+        self._text = []
+        if self._tag is not None:
+            self._line(self._tag + ">")
+            self._tag = None
+            self._depth += 1
+        self._write_text(text)
+
+    def _write_text(self, text):
+        text = text.strip()
+        if text != "":
+            self._line(text)
+
+    def _line(self, content):
+        self._dst.write(self._indent * self._depth + content + '\n')
+
+
+def format_xml_stream(filepath, dst, indent=4):
+    """
+    Writes the indented contents of a XML file.
+
+    Args:
+        filepath (str): The XML file.
+        dst (TextIO): The file object to write the formatted document to.
+        indent (int): The indentation width.
+
+    Raises:
+        xml.parsers.expat.ExpatError: If the document is not well-formed.
+    """
+    indenter = XmlIndenter(dst, indent)
+    indenter.start_document()
+    f = open(filepath, 'rb')
+    try:
+        indenter.parser().ParseFile(f)
+    finally:
+        f.close()
+
+
+def format_xml_str(content, indent=4):
+    """
+    Returns the indented version of a string holding a XML document.
+    The lxml package is used if installed and if its output is the same as the one of XmlIndenter,
+    so that a document is formatted the same way with or without lxml, in memory or incrementally.
+
+    Args:
+        content (str): The XML document.
+        indent (int): The indentation width.
+
+    Raises:
+        xml.parsers.expat.ExpatError: If the document is not well-formed.
+    """
+    if etree is not None and _is_lxml_safe(content):
+        try:
+            root = _parse_xml_lxml(content)
+            if root is not None:
+                etree.indent(root, space=' ' * indent)
+                return '<?xml version="1.0" ?>\n' + etree.tostring(root, encoding="unicode") + '\n'
+        except (etree.XMLSyntaxError, ValueError):
+            # Let expat report the error
+            pass
+    dst = io.StringIO()
+    indenter = XmlIndenter(dst, indent)
+    indenter.start_document()
+    indenter.parser().Parse(content, True)
+    return dst.getvalue()
+
+
+def _is_lxml_safe(content):
+    """
+    Whether a XML document has none of the nodes written differently by lxml and XmlIndenter:
+    comments, processing instructions, CDATA sections, document type declarations and namespace declarations.
+    """
+    if not isinstance(content, str):
+        return False
+    # The XML declaration is the only processing instruction allowed, at the start of the document.
+    return not any(token in content for token in ("<!", "xmlns")) and content.find("<?", 1) == -1
+
+
+def _parse_xml_lxml(content):
+    """
+    Parses a XML document with lxml.
+
+    Returns:
+        lxml.etree._Element: The root element. None if the document has mixed content,
+                             whitespace-only text or attribute values with double quotes,
+                             which lxml and XmlIndenter write differently.
+    """
+    parser = etree.XMLParser(remove_blank_text=True, resolve_entities=False)
+    root = etree.fromstring(content, parser)
+    for element in root.iter():
+        text = element.text
+        if element.tail is not None or (text is not None and (len(element) > 0 or text.strip() == "")):
+            return None
+        for value in element.attrib.values():
+            if '"' in value:
+                return None
+    return root
+
+#
+# In-memory formatters.
+#
+def format_json_str(content, indent=4):
+    """
+    Returns the indented version of a string holding a JSON document, with the same layout as json.dumps.
+    The orjson package is used if installed. Its output is rewritten like the one of json.dumps
+    (escaped non-ASCII characters, floats written as by repr), so that a document is formatted the same way
+    with or without orjson.
+
+    Raises:
+        ValueError: If the document is not valid JSON.
+    """
+    if orjson is not None:
+        result = None
+        try:
+            result = _format_json_str_orjson(content, indent)
+        except (orjson.JSONDecodeError, orjson.JSONEncodeError):
+            # Let the json module parse NaN, infinities and lone surrogates, or report the error
+            pass
+        if result is not None:
+            return result
+    return json.dumps(json.loads(content), indent=indent) + '\n'
+
+
+# Characters written as is by orjson and escaped by json.dumps.
+_json_escaped = re.compile(r'[^\x00-\x7e]')
+# Exponent of the floats written by orjson, which writes the floats below 1e-4 in decimal notation.
+_orjson_exponent = re.compile(r'e[-0-9]')
+# Floats that orjson may write differently from repr, as values of the indented output of orjson: at the start of a line or after a key,
+# and followed by a comma or the end of the line. JSON strings have no raw line breaks, so they can't match.
+_orjson_float_value = re.compile(r'(^ *|": )(-?[0-9][0-9.]*[eE][-+]?[0-9]+|-?0\.0000[0-9]*)(?=,?$)', re.MULTILINE)
+# Integers that may not fit in 64 bits, read as floats by orjson.
+_json_long_number = re.compile(r'[0-9]{19}')
+
+
+def _format_json_str_orjson(content, indent):
+    """
+    Returns the indented version of a JSON document formatted by orjson, with the same layout as json.dumps.
+
+    Returns:
+        str: The formatted document. None if the document may have integers read as floats by orjson.
+    """
+    result = orjson.dumps(orjson.loads(content), option=orjson.OPT_INDENT_2).decode("utf-8")
+    if '0.0000' in result or _orjson_exponent.search(result) is not None:
+        if not isinstance(content, str) or _json_long_number.search(content) is not None:
+            return None
+        result = _orjson_float_value.sub(lambda match: match.group(1) + repr(float(match.group(2))), result)
+    if not result.isascii() or '\x7f' in result:
+        # Outside strings, JSON documents are ASCII-only.
+        result = _json_escaped.sub(_escape_json_char, result)
+    if indent != 2:
+        # JSON strings have no raw line breaks: the leading spaces of each line are indentation only.
+        # The levels of indentation are replaced one by one with a non-ASCII marker, absent from the document.
+        result = result.replace('\n  ', '\n\uffff')
+        while '\uffff  ' in result:
+            result = result.replace('\uffff  ', '\uffff\uffff')
+        result = result.replace('\uffff', ' ' * indent)
+    return result + '\n'
+
+
+def _escape_json_char(match):
+    """ Returns the escape sequence of a character, as written by json.dumps. """
+    code = ord(match.group())
+    if code < 0x10000:
+        return f"\\u{code:04x}"
+    code -= 0x10000
+    return f"\\u{0xd800 | (code >> 10):04x}\\u{0xdc00 | (code & 0x3ff):04x}"
+
+
+def format_yaml_str(content, indent=4):
+    """
+    Returns the indented version of a string holding a YAML document, with sorted mapping keys.
+    The LibYAML bindings are used if available.
+    """
+    return yaml.dump(yaml.load(content, Loader=SafeLoader), indent=indent, Dumper=SafeDumper)
+
+
+#
+# Memo of the formatted files.
+# Files added in many tests, like schemas or golden responses, are read and formatted once
+# as long as they are not modified.
+#
+MEMO_SIZE = 64
+MEMO_MAX_LENGTH = 1024 * 1024
+
+_memo = collections.OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def format_file(filepath, indent, kind, format_str):
+    """
+    Returns the formatted contents of a file.
+    The results are memoized by path, modification time, size and indentation.
+    Results longer than MEMO_MAX_LENGTH characters are not memoized.
+
+    Args:
+        filepath (str): The file.
+        indent (int): The indentation width.
+        kind (str): The kind of document, e.g. 'json'. Part of the memo key.
+        format_str (function): Called as format_str(content, indent). Returns the formatted document.
+    """
+    stat = os.stat(filepath)
+    key = (kind, os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, indent)
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+    f = open(filepath, 'r')
+    try:
+        content = f.read()
+    finally:
+        f.close()
+    result = format_str(content, indent)
+    if len(result) <= MEMO_MAX_LENGTH:
+        with _memo_lock:
+            _memo[key] = result
+            while len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+    return result
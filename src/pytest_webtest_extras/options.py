@@ -0,0 +1,148 @@
+import collections
+import importlib.util
+import sys
+import types
+import pytest
+from . import utils
+
+
+#
+# Options of the plugin, resolved once per session from the INI file and the command-line options.
+#
+Options = collections.namedtuple("Options", [
+    "html",
+    "html_plugin",
+    "report_folder",
+    "report_allure",
+    "allure_only",
+    "css",
+    "screenshots",
+    "buffer_size",
+    "comments",
+    "sources",
+    "description_tag",
+    "image_format",
+    "image_quality",
+    "preview_limit",
+    "write_payloads",
+    "tiling",
+    "source_compression",
+    "thumbnails",
+    "similarity",
+    "async_writes",
+    "writer_threads",
+    "deduplicate",
+    "storage",
+    "history_runs",
+    "history_size",
+    "slowest_captures",
+    "namespace",
+    "distributed",
+])
+Options.__doc__ = """
+Options of the plugin, resolved at configuration time and stored in the pytest config stash.
+The values are those of the session fixtures of the same name.
+"""
+
+key = pytest.StashKey[Options]()
+
+
+def get(config):
+    """ Returns the options of the plugin, resolved by 'resolve' if not done yet. """
+    options = config.stash.get(key, None)
+    if options is None:
+        options = resolve(config)
+        config.stash[key] = options
+    return options
+
+
+def resolve(config):
+    """ Resolves the options of the plugin from the INI file and the command-line options. """
+    html = config.getoption("--html", default=None)
+    report_allure = config.getoption("--alluredir", default=None) is not None
+    return Options(
+        html=html,
+        html_plugin=config.pluginmanager.getplugin('html'),
+        report_folder=utils.get_folder(html),
+        report_allure=report_allure,
+        allure_only=report_allure and config.getini("extras_allure_only"),
+        css=config.getoption("--css", default=None),
+        screenshots=_get_screenshots(config),
+        buffer_size=_number(config, "extras_failure_buffer", int, 10, minimum=1),
+        comments=config.getini("extras_comments"),
+        sources=config.getini("extras_sources"),
+        description_tag=_choice(config.getini("extras_description_tag"), ("h1", "h2", "h3", "p", "pre"), "h2"),
+        image_format=_get_image_format(config),
+        image_quality=_number(config, "extras_image_quality", int, 80, minimum=0, maximum=100),
+        preview_limit=_number(config, "extras_preview_limit", int, 0, minimum=0),
+        write_payloads=config.getini("extras_write_payloads"),
+        tiling=types.MappingProxyType({
+            'tile_height': _number(config, "extras_tile_height", int, 0, minimum=0),
+            'max_height': _number(config, "extras_capture_max_height", int, 0, minimum=0),
+            'timeout': _number(config, "extras_capture_timeout", float, 0, minimum=0),
+        }),
+        source_compression=types.MappingProxyType({
+            'compression': _choice(config.getini("extras_source_compression").lower(), ("gzip", "delta"), None),
+            'snapshot': _number(config, "extras_source_snapshot", int, 10, minimum=1),
+        }),
+        thumbnails=_get_thumbnails(config),
+        similarity=_get_similarity(config),
+        async_writes=config.getini("extras_async_writes"),
+        writer_threads=_number(config, "extras_writer_threads", int, 4, minimum=1),
+        deduplicate=config.getini("extras_deduplicate"),
+        storage=_choice(config.getini("extras_storage"), ("files", "pack"), "files"),
+        history_runs=_number(config, "extras_history_runs", int, 0, minimum=0),
+        history_size=int(_number(config, "extras_history_size", float, 0, minimum=0) * 2**20),
+        slowest_captures=_number(config, "extras_slowest_captures", int, 0, minimum=0),
+        namespace=utils.get_worker_id(config),
+        distributed=utils.is_distributed(config),
+    )
+
+
+def _choice(value, values, default):
+    return value if value in values else default
+
+
+def _number(config, name, cast, default, minimum=None, maximum=None):
+    try:
+        value = cast(config.getini(name))
+    except ValueError:
+        return default
+    if minimum is not None:
+        value = max(minimum, value)
+    if maximum is not None:
+        value = min(maximum, value)
+    return value
+
+
+def _get_screenshots(config):
+    value = config.getini("extras_screenshots").replace(' ', '')
+    return value if utils.get_screenshots_policy(value) is not None else "all"
+
+
+def _get_image_format(config):
+    value = config.getini("extras_image_format").lower()
+    value = "jpeg" if value == "jpg" else value
+    if value not in ("png", "jpeg", "webp"):
+        return "png"
+    if value != "png" and importlib.util.find_spec('PIL') is None:
+        print("Pillow module is not installed. "
+              "Screenshots not taken natively in the requested format will be saved as PNG.", file=sys.stderr)
+    return value
+
+
+def _get_thumbnails(config):
+    if not config.getini("extras_thumbnails"):
+        return False
+    if importlib.util.find_spec('PIL') is None:
+        print("Pillow module is not installed. Screenshot previews are disabled.", file=sys.stderr)
+        return False
+    return True
+
+
+def _get_similarity(config):
+    value = _number(config, "extras_similarity_threshold", float, 0.0, minimum=0.0, maximum=1.0)
+    if value > 0 and (importlib.util.find_spec('numpy') is None or importlib.util.find_spec('PIL') is None):
+        print("NumPy or Pillow module is not installed. Near-duplicate screenshots are written.", file=sys.stderr)
+        return 0.0
+    return value
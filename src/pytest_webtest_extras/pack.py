@@ -0,0 +1,289 @@
+"""
+Pack storage of the screenshots and webpage sources.
+
+The files are appended to a pack file of the report folder instead of being written one by one.
+Each pack file has an index file with a line per file: offset, size and link.
+
+The report links keep pointing to the files in the 'screenshots' and 'sources' folders.
+They are resolved into the packs, and the compressed webpage sources are rebuilt,
+by serving the report folder or after extracting the packs:
+
+    python -m pytest_webtest_extras.pack serve <report_folder> [--port PORT]
+    python -m pytest_webtest_extras.pack extract <report_folder>
+"""
+import argparse
+import functools
+import glob
+import http.server
+import io
+import os
+import posixpath
+import shutil
+import sys
+import threading
+import urllib.parse
+from . import sources
+
+
+FOLDER = "packs"
+BUFFER_SIZE = 1024 * 1024
+
+
+def get_link_key(link):
+    """ Returns the key of a file link in the pack indexes: the link with forward slashes. """
+    return link.replace(os.sep, '/')
+
+
+def normalize_key(key):
+    """
+    Normalizes the link of a file of the report folder, with forward slashes.
+
+    Returns:
+        str: The normalized link. None if the link is absolute or points outside the report folder.
+    """
+    if key == '' or '\\' in key or '\0' in key or posixpath.isabs(key) or os.path.isabs(key):
+        return None
+    key = posixpath.normpath(key)
+    if key == '.' or key == '..' or key.startswith("../"):
+        return None
+    return key
+
+
+class Pack:
+    """
+    Append-only pack file with its index.
+    The file writes are buffered and can be done from several threads.
+    """
+
+    def __init__(self, report_folder, name, buffer_size=BUFFER_SIZE):
+        """
+        Args:
+            report_folder (str): The folder storing the pytest-html report.
+            name (str): The name of the pack file, without extension.
+                        Each pytest-xdist worker must use its own pack.
+            buffer_size (int): The size in bytes of the write buffer.
+        """
+        folder = os.path.join(report_folder or '', FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f"{name}.pack")
+        self._data = open(self.path, 'ab', buffering=buffer_size)
+        self._index = open(os.path.join(folder, f"{name}.idx"), 'a', encoding="utf-8", buffering=buffer_size)
+        self._offset = self._data.tell()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def write(self, link, data):
+        """
+        Appends a file to the pack.
+
+        Args:
+            link (str): The link of the file, relative to the report folder.
+            data (bytes | str): The content of the file. Strings are encoded in UTF-8.
+
+        Returns:
+            str: The link of the file.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        key = get_link_key(link)
+        with self._lock:
+            self._data.write(data)
+            self._index.write(f"{self._offset} {len(data)} {key}\n")
+            self._entries[key] = (self._offset, len(data))
+            self._offset += len(data)
+        return link
+
+    def read(self, link):
+        """ Returns the content of a file of the pack. """
+        with self._lock:
+            offset, size = self._entries[get_link_key(link)]
+            self._data.flush()
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def close(self):
+        """ Writes the buffered data and closes the pack. """
+        with self._lock:
+            self._data.close()
+            self._index.close()
+
+
+def read_indexes(report_folder):
+    """
+    Reads the indexes of the packs of a report folder.
+
+    Returns:
+        dict: The pack file, offset and size of each file, keyed by link.
+    """
+    entries = {}
+    for index in sorted(glob.glob(os.path.join(report_folder or '', FOLDER, "*.idx"))):
+        path = index[:-len(".idx")] + ".pack"
+        with open(index, 'r', encoding="utf-8") as f:
+            for line in f:
+                offset, size, key = line.rstrip('\n').split(' ', 2)
+                entries[key] = (path, int(offset), int(size))
+    return entries
+
+
+def read_entry(entry):
+    """ Returns the content of a file from its pack index entry. """
+    path, offset, size = entry
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def read_file(report_folder, entries, key):
+    """
+    Returns the content of a file of a report folder, or of its packs.
+
+    Args:
+        report_folder (str): The folder of the report.
+        entries (dict): The entries of the pack indexes, returned by 'read_indexes'.
+        key (str): The link of the file, with forward slashes.
+
+    Returns:
+        bytes: The content of the file. None if the file doesn't exist or is outside the report folder.
+    """
+    key = normalize_key(key)
+    if key is None:
+        return None
+    folder = os.path.realpath(report_folder or '.')
+    filename = os.path.realpath(os.path.join(folder, *key.split('/')))
+    if os.path.commonpath([folder, filename]) != folder:
+        return None
+    if os.path.isfile(filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+    if key in entries:
+        return read_entry(entries[key])
+    return None
+
+
+def extract(report_folder):
+    """
+    Writes the files of the packs of a report folder to their links,
+    and the compressed webpage sources to their links uncompressed.
+
+    Returns:
+        int: The number of extracted files.
+    """
+    count = _extract_packs(report_folder)
+    entries = read_indexes(report_folder)
+    folder = os.path.join(report_folder or '', "sources")
+    for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        for suffix in (sources.DELTA_SUFFIX, sources.GZIP_SUFFIX):
+            if name.endswith(suffix) and not os.path.exists(os.path.join(folder, name[:-len(suffix)])):
+                key = f"sources/{name[:-len(suffix)]}"
+                source = sources.read(key, functools.partial(read_file, report_folder, entries))
+                with open(os.path.join(folder, name[:-len(suffix)]), 'w', encoding="utf-8") as f:
+                    f.write(source)
+                count += 1
+                break
+    return count
+
+
+def _extract_packs(report_folder):
+    """ Writes the files of the packs of a report folder to their links. """
+    entries = read_indexes(report_folder)
+    handles = {}
+    try:
+        for key, (path, offset, size) in entries.items():
+            if path not in handles:
+                handles[path] = open(path, 'rb')
+            src = handles[path]
+            src.seek(offset)
+            filename = os.path.join(report_folder or '', *key.split('/'))
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'wb') as dst:
+                shutil.copyfileobj(_Slice(src, size), dst)
+    finally:
+        for handle in handles.values():
+            handle.close()
+    return len(entries)
+
+
+class _Slice:
+    """ File object reading a given number of bytes from the current position of another file. """
+
+    def __init__(self, f, size):
+        self._f = f
+        self._left = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self._left:
+            size = self._left
+        data = self._f.read(size)
+        self._left -= len(data)
+        return data
+
+
+class PackRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves the files of the report folder, the files of the packs missing from the report folder,
+    and the compressed webpage sources.
+    """
+
+    def __init__(self, *args, entries=None, **kwargs):
+        self._entries = entries
+        super().__init__(*args, **kwargs)
+
+    def send_head(self):
+        key = self.path.split('?', 1)[0].split('#', 1)[0].lstrip('/')
+        key = normalize_key(urllib.parse.unquote(key))
+        if key is None:
+            # Served, or rejected, by translate_path
+            return super().send_head()
+        if key in self._entries and not os.path.exists(self.translate_path(self.path)):
+            data = read_entry(self._entries[key])
+            self.send_response(200)
+            self.send_header("Content-Type", self.guess_type(key))
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            return io.BytesIO(data)
+        if key.startswith("sources/") and not os.path.exists(self.translate_path(self.path)):
+            source = sources.read(key, functools.partial(read_file, self.directory, self._entries))
+            if source is not None:
+                data = source.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                return io.BytesIO(data)
+        return super().send_head()
+
+
+def serve(report_folder, port=8000):
+    """ Serves a report folder on localhost, resolving the links of the report into its packs. """
+    entries = read_indexes(report_folder)
+    handler = functools.partial(PackRequestHandler, directory=report_folder or '.', entries=entries)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    print(f"Serving {len(entries)} packed files of {report_folder or '.'} on http://127.0.0.1:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pytest_webtest_extras.pack")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser(
+        "extract", help="Write the packed files and the uncompressed webpage sources to the report folder.")
+    command.add_argument("folder", help="The folder of the pytest-html report.")
+    command = commands.add_parser("serve", help="Serve the report folder, resolving the links into the packs.")
+    command.add_argument("folder", help="The folder of the pytest-html report.")
+    command.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+    if args.command == "extract":
+        print(f"{extract(args.folder)} files extracted.")
+    else:
+        serve(args.folder, args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
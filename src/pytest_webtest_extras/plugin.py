@@ -1,7 +1,10 @@
 import os
 import pytest
+from . import options
 from . import utils
 from .extras import Extras
+from .pack import Pack
+from .writer import Writer
 
 
 #
@@ -12,7 +15,14 @@ def pytest_addoption(parser):
         "extras_screenshots",
         type="string",
         default="all",
-        help="The screenshots to include in the report. Accepted values: all, last, none."
+        help="The screenshots to include in the report. "
+             "Accepted values: all, last, on-failure, none, every:N, interval:T, ring:K."
+    )
+    parser.addini(
+        "extras_failure_buffer",
+        type="string",
+        default="10",
+        help="The maximum number of screenshots kept in memory per test in 'on-failure' mode."
     )
     parser.addini(
         "extras_comments",
@@ -26,92 +36,466 @@ def pytest_addoption(parser):
         default=False,
         help="Whether to include webpage sources."
     )
+    parser.addini(
+        "extras_source_compression",
+        type="string",
+        default="none",
+        help="How to compress the webpage sources. Accepted values: none, gzip, delta."
+    )
+    parser.addini(
+        "extras_source_snapshot",
+        type="string",
+        default="10",
+        help="The number of steps between full webpage sources of a test in 'delta' compression."
+    )
     parser.addini(
         "extras_description_tag",
         type="string",
         default="h2",
         help="HTML tag for the test description. Accepted values: h1, h2, h3, p or pre.",
     )
+    parser.addini(
+        "extras_preview_limit",
+        type="string",
+        default="0",
+        help="The maximum size in bytes of the files added by the add_*_file methods to be printed in full. "
+             "Larger files are formatted in the payloads folder and only their beginning is printed. "
+             "0 for no limit."
+    )
+    parser.addini(
+        "extras_write_payloads",
+        type="bool",
+        default=False,
+        help="Whether to write the documents added by the add_* methods in the payloads folder. "
+             "Only their beginning is printed and links to them are added to the report."
+    )
+    parser.addini(
+        "extras_async_writes",
+        type="bool",
+        default=False,
+        help="Whether to write screenshots and webpage sources in background threads."
+    )
+    parser.addini(
+        "extras_writer_threads",
+        type="string",
+        default="4",
+        help="The number of background threads writing screenshots and webpage sources."
+    )
+    parser.addini(
+        "extras_allure_only",
+        type="bool",
+        default=False,
+        help="Whether to attach the screenshots and webpage sources to the Allure report only, "
+             "without writing them for the pytest-html report."
+    )
+    parser.addini(
+        "extras_image_format",
+        type="string",
+        default="png",
+        help="The file format of the screenshots. Accepted values: png, jpeg, webp."
+    )
+    parser.addini(
+        "extras_image_quality",
+        type="string",
+        default="80",
+        help="The quality (0-100) of JPEG and WebP screenshots."
+    )
+    parser.addini(
+        "extras_tile_height",
+        type="string",
+        default="0",
+        help="The height in pixels of the clips of Chromium full-page screenshots taken by tiles. "
+             "0 to take full-page screenshots in a single capture. Requires the Pillow package."
+    )
+    parser.addini(
+        "extras_capture_max_height",
+        type="string",
+        default="0",
+        help="The maximum height in pixels of Chromium full-page screenshots. 0 for no limit."
+    )
+    parser.addini(
+        "extras_capture_timeout",
+        type="string",
+        default="0",
+        help="The time budget in seconds of Chromium full-page screenshots taken by tiles. 0 for no limit."
+    )
+    parser.addini(
+        "extras_thumbnails",
+        type="bool",
+        default=False,
+        help="Whether to display downscaled previews of the screenshots. Requires the Pillow package."
+    )
+    parser.addini(
+        "extras_similarity_threshold",
+        type="string",
+        default="0",
+        help="The mean difference (0-1) below which a screenshot is considered the same as the previous one "
+             "of the test and not written. 0 to write all the screenshots. Requires the NumPy and Pillow packages."
+    )
+    parser.addini(
+        "extras_deduplicate",
+        type="bool",
+        default=False,
+        help="Whether to write identical screenshots and webpage sources only once per session."
+    )
+    parser.addini(
+        "extras_storage",
+        type="string",
+        default="files",
+        help="How to store the screenshots and webpage sources. Accepted values: files, pack."
+    )
+    parser.addini(
+        "extras_history_runs",
+        type="string",
+        default="0",
+        help="The number of previous runs whose screenshots and webpage sources are kept in the history folder."
+    )
+    parser.addini(
+        "extras_history_size",
+        type="string",
+        default="0",
+        help="The maximum size in MB of the history folder. The oldest runs are deleted first. 0 for no limit."
+    )
+    parser.addini(
+        "extras_slowest_captures",
+        type="string",
+        default="0",
+        help="The number of slowest screenshots to list in the terminal summary, "
+             "with the time spent in each phase. 0 to disable the summary."
+    )
 
 
 #
 # Read test parameters
+# The options are resolved once per session by pytest_configure and stored in the config stash.
 #
 @pytest.fixture(scope='session')
 def screenshots(request):
-    value = request.config.getini("extras_screenshots")
-    if value in ("all", "last", "none"):
-        return value
-    else:
-        return "all"
+    return options.get(request.config).screenshots
+
+
+@pytest.fixture(scope='session')
+def buffer_size(request):
+    """ The maximum number of screenshots kept in memory per test in 'on-failure' mode. """
+    return options.get(request.config).buffer_size
+
+
+@pytest.fixture(scope='session')
+def image_format(request):
+    """ The file format of the screenshots. """
+    return options.get(request.config).image_format
+
+
+@pytest.fixture(scope='session')
+def image_quality(request):
+    """ The quality of JPEG and WebP screenshots. """
+    return options.get(request.config).image_quality
+
+
+@pytest.fixture(scope='session')
+def preview_limit(request):
+    """ The maximum size of the files added by the add_*_file methods to be printed in full. """
+    return options.get(request.config).preview_limit
+
+
+@pytest.fixture(scope='session')
+def write_payloads(request):
+    """ Whether to write the documents added by the add_* methods in the payloads folder. """
+    return options.get(request.config).write_payloads
+
+
+@pytest.fixture(scope='session')
+def tiling(request):
+    """ The memory and time budgets of Chromium full-page screenshots. """
+    return options.get(request.config).tiling
+
+
+@pytest.fixture(scope='session')
+def source_compression(request):
+    """ The compression of the webpage sources. """
+    return options.get(request.config).source_compression
+
+
+@pytest.fixture(scope='session')
+def thumbnails(request):
+    """ Whether to display downscaled previews of the screenshots. """
+    return options.get(request.config).thumbnails
+
+
+@pytest.fixture(scope='session')
+def similarity(request):
+    """ The difference below which a screenshot is considered the same as the previous one. """
+    return options.get(request.config).similarity
 
 
 @pytest.fixture(scope='session')
 def report_folder(request):
     """ The folder storing the pytest-html report """
-    htmlpath = request.config.getoption("--html")
-    return utils.get_folder(htmlpath)
+    return options.get(request.config).report_folder
 
 
 @pytest.fixture(scope='session')
 def report_allure(request):
     """ Whether the allure-pytest plugin is being used """
-    return request.config.getoption("--alluredir", default=None) is not None
+    return options.get(request.config).report_allure
+
+
+@pytest.fixture(scope='session')
+def allure_only(request):
+    """ Whether to attach the screenshots and webpage sources to the Allure report only. """
+    return options.get(request.config).allure_only
 
 
 @pytest.fixture(scope='session')
 def report_css(request):
     """ The filepath of the CSS to include in the report. """
-    return request.config.getoption("--css")
+    return options.get(request.config).css
 
 
 @pytest.fixture(scope='session')
 def description_tag(request):
     """ The HTML tag for the description of each test. """
-    tag = request.config.getini("extras_description_tag")
-    return tag if tag in ("h1", "h2", "h3", "p", "pre") else "h2"
+    return options.get(request.config).description_tag
 
 
 @pytest.fixture(scope='session')
 def comments(request):
     """ Whether to include the gathered comments in the report. """
-    return request.config.getini("extras_comments")
+    return options.get(request.config).comments
 
 
 @pytest.fixture(scope='session')
 def sources(request):
     """ Whether to include webpage sources in the report. """
-    return request.config.getini("extras_sources")
+    return options.get(request.config).sources
+
+
+@pytest.fixture(scope='session')
+def async_writes(request):
+    """ Whether to write the screenshots and webpage sources in background threads. """
+    return options.get(request.config).async_writes
+
+
+@pytest.fixture(scope='session')
+def writer(request, pack):
+    """
+    The background writer of screenshots and webpage sources.
+    Its threads are only started when the first file is written in the background.
+    It depends on the 'pack' fixture, so that the pending write operations are over before the pack is closed.
+    """
+    pool = Writer(options.get(request.config).writer_threads)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture(scope='session')
+def store(request):
+    """
+    The links of the files written during the session, keyed by the hash of their content.
+    None if identical files are not deduplicated.
+    """
+    return {} if options.get(request.config).deduplicate else None
+
+
+@pytest.fixture(scope='session')
+def namespace(request):
+    """ The prefix of the file names. The pytest-xdist worker id if running distributed tests. """
+    return options.get(request.config).namespace
 
 
 @pytest.fixture(scope='session')
-def check_options(request, report_folder):
+def check_options(request):
     """ Verifies preconditions before using this plugin. """
-    utils.check_html_option(report_folder)
-    utils.create_assets(report_folder)
+    opts = options.get(request.config)
+    if opts.allure_only:
+        return
+    utils.check_html_option(opts.report_folder)
+    # The assets of distributed tests are created by the pytest-xdist controller.
+    if not opts.distributed and opts.namespace is None:
+        create_assets(opts)
+
+
+@pytest.fixture(scope='session')
+def pack(request, check_options):
+    """
+    The pack file the screenshots and webpage sources are appended to.
+    None if they are written as separate files.
+    """
+    opts = options.get(request.config)
+    if opts.storage != "pack" or opts.allure_only:
+        yield None
+        return
+    # Each pytest-xdist worker appends to its own pack.
+    storage = Pack(opts.report_folder, opts.namespace or "main")
+    yield storage
+    storage.close()
 
 
 #
 # Test fixture
 #
 @pytest.fixture(scope='function')
-def report(request, report_folder, screenshots, comments, sources, report_allure, check_options):
-    return Extras(report_folder, screenshots, comments, sources, report_allure)
+def report(request, writer, store, pack, check_options):
+    opts = options.get(request.config)
+    return Extras(
+        opts.report_folder, opts.screenshots, opts.comments, opts.sources, opts.report_allure,
+        writer=writer,
+        store=store,
+        namespace=opts.namespace,
+        buffer_size=opts.buffer_size,
+        thumbnails=opts.thumbnails,
+        image_format=opts.image_format,
+        image_quality=opts.image_quality,
+        preview_limit=opts.preview_limit,
+        write_payloads=opts.write_payloads,
+        allure_only=opts.allure_only,
+        tiling=opts.tiling,
+        async_writes=opts.async_writes,
+        pack=pack,
+        similarity=opts.similarity,
+        source_compression=opts.source_compression,
+    )
 
 
 #
 # Hookers
 #
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    # Resolve the options once for the session, instead of in each test and report hook.
+    # Last, so that the pytest-html plugin is already registered.
+    opts = options.resolve(config)
+    config.stash[options.key] = opts
+    if opts.namespace is not None:
+        return
+    config.pluginmanager.register(Manifest(opts.report_folder), "webtest_extras_manifest")
+    if opts.slowest_captures > 0:
+        config.pluginmanager.register(Timings(opts.slowest_captures), "webtest_extras_timings")
+    # Create the assets once for all the pytest-xdist workers.
+    if opts.distributed and opts.report_folder is not None:
+        create_assets(opts)
+
+
+def create_assets(opts):
+    """ Creates the assets, keeping the previous runs in the history folder as configured. """
+    utils.create_assets(opts.report_folder, opts.history_runs, opts.history_size)
+
+
+class Manifest:
+    """
+    Writes the manifest records of the tests, including the ones of pytest-xdist workers,
+    in the manifest.jsonl file of the report folder as the tests finish.
+    """
+
+    def __init__(self, report_folder):
+        self._folder = report_folder
+        self._file = None
+        self._failed = False
+
+    def pytest_runtest_logreport(self, report):
+        records = getattr(report, "extras_manifest", None)
+        if not records or self._failed:
+            return
+        if self._file is None:
+            self._file = utils.open_manifest(self._folder)
+            self._failed = self._file is None
+            if self._failed:
+                return
+        utils.write_manifest(self._file, records)
+        # The records are not kept in memory with the report.
+        del report.extras_manifest
+
+    def pytest_sessionfinish(self, session):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Timings:
+    """
+    Gathers the timing records of the screenshots, including the ones of pytest-xdist workers,
+    and lists the slowest screenshots and the time spent in each phase in the terminal summary.
+    """
+    phases = ("capture", "decode", "write", "allure")
+
+    def __init__(self, slowest):
+        self.records = []
+        self._slowest = slowest
+
+    def pytest_runtest_logreport(self, report):
+        for timing in getattr(report, "extras_timings", None) or []:
+            self.records.append((report.nodeid, timing))
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if len(self.records) == 0:
+            return
+        terminalreporter.write_sep("=", "slowest screenshots")
+        records = sorted(self.records, key=lambda record: -sum(record[1][phase] for phase in self.phases))
+        for nodeid, timing in records[:self._slowest]:
+            total = sum(timing[phase] for phase in self.phases)
+            phases = ", ".join(f"{phase} {timing[phase]:.3f}s" for phase in self.phases)
+            step = "" if timing["step"] is None else f" step {timing['step'] + 1}"
+            comment = timing["comment"] if len(timing["comment"]) <= 40 else timing["comment"][:37] + "..."
+            comment = f" '{comment}'" if comment != "" else ""
+            terminalreporter.write_line(f"{total:.3f}s {nodeid}{step}{comment} ({phases})")
+        totals = ", ".join(
+            f"{phase} {sum(timing[phase] for _, timing in self.records):.3f}s" for phase in self.phases
+        )
+        terminalreporter.write_line(f"Total of {len(self.records)} screenshots: {totals}")
+
+
 @pytest.hookimpl(trylast=True)
 def pytest_sessionfinish(session, exitstatus):
     import warnings
     warnings.warn("\n\npytest-webtest-extras plugin is deprecated.\nPlease use 'pytest-report-extras' plugin instead (https://pytest-report-extras.readthedocs.io/stable/)\n", DeprecationWarning)
 
 
+def get_artifact_fields(artifacts):
+    """ Returns the manifest fields of the screenshot and webpage source files written for a step. """
+    image = artifacts["image"] or {}
+    source = artifacts["source"] or {}
+    return {
+        "image_size": image.get("size"),
+        "image_hash": image.get("hash"),
+        "source_size": source.get("size"),
+        "source_hash": source.get("hash"),
+    }
+
+
+def get_manifest_records(nodeid, fx_report):
+    """
+    Returns the manifest records of the steps of a test: links, sizes and hashes of the written files, and timings.
+    The values of grouped steps are lists.
+    """
+    timings = {timing["step"]: timing for timing in fx_report.timings}
+    records = []
+    for i in range(len(fx_report.images)):
+        # Steps appended to the lists directly have no sizes and hashes.
+        artifacts = fx_report.artifacts[i] if i < len(fx_report.artifacts) else {}
+        if isinstance(artifacts, list):
+            values = [get_artifact_fields(value) for value in artifacts]
+            artifacts = {key: [value[key] for value in values] for key in values[0]} if values else {}
+        elif artifacts:
+            artifacts = get_artifact_fields(artifacts)
+        timing = timings.get(i)
+        records.append({
+            "nodeid": nodeid,
+            "step": i,
+            "comment": fx_report.comments[i],
+            "image": fx_report.images[i],
+            "thumbnail": fx_report.thumbnails[i],
+            "source": fx_report.sources[i],
+            **artifacts,
+            "timings": None if timing is None else {phase: timing[phase] for phase in Timings.phases},
+        })
+    return records
+
+
 @pytest.hookimpl(hookwrapper=True)
 def pytest_runtest_makereport(item, call):
     """ Override report generation. """
-    pytest_html = item.config.pluginmanager.getplugin('html')
+    opts = item.config.stash[options.key]
+    pytest_html = opts.html_plugin
     outcome = yield
     report = outcome.get_result()
     extras = getattr(report, 'extras', [])
@@ -121,63 +505,56 @@ def pytest_runtest_makereport(item, call):
         return
 
     if report.when == 'call':
-        # Get test fixture values
-        feature_request = item.funcargs['request']
-        fx_report = feature_request.getfixturevalue("report")
-        fx_description_tag = feature_request.getfixturevalue("description_tag")
-        fx_screenshots = feature_request.getfixturevalue("screenshots")
-        fx_comments = feature_request.getfixturevalue("comments")
+        # Get the test fixture value and the session options
+        fx_report = item.funcargs['report']
+        fx_description_tag = opts.description_tag
+        fx_screenshots = opts.screenshots
+        fx_comments = opts.comments
+        fx_report.flush(report.failed)
+        if len(fx_report.timings) > 0:
+            report.extras_timings = fx_report.timings
         images = fx_report.images
         sources = fx_report.sources
+        thumbnails = fx_report.thumbnails
         comments = fx_report.comments
 
         # Append test description and execution exception trace, if any.
         description = item.function.__doc__ if hasattr(item, 'function') else None
         utils.append_header(call, report, extras, pytest_html, description, fx_description_tag)
 
+        # Append links to the documents written in the payloads folder
+        if len(fx_report.payloads) > 0:
+            extras.append(pytest_html.extras.html(utils.decorate_payloads(fx_report.payloads)))
+            report.extras = extras
+
         if fx_screenshots == "none" or len(images) == 0:
             return
 
         if not utils.check_lists_length(report, fx_report):
             return
 
-        # Generate HTML code for the extras to be added in the report
-        links = ""  # Used when logging without comments
-        rows = ""   # Used when logging with comments
-        if fx_screenshots == "all":
-            if not fx_comments:
-                for i in range(len(images)):
-                    links += utils.decorate_anchors(images[i], sources[i])
-            else:
-                for i in range(len(images)):
-                    rows += utils.get_table_row_tag(comments[i], images[i], sources[i])
-        else:  # fx_screenshots == "last"
-            if len(images) > 0:
-                if not fx_comments:
-                    links = utils.decorate_anchors(images[-1], sources[-1])
-                else:
-                    rows += utils.get_table_row_tag(comments[-1], images[-1], sources[-1])
+        # Manifest records of the test, gathered by the session (or pytest-xdist controller) manifest
+        report.extras_manifest = get_manifest_records(item.nodeid, fx_report)
+
+        # Generate HTML code for the extras to be added in the report:
+        # anchors when logging without comments, table rows when logging with comments.
+        steps = utils.render_steps(images, sources, thumbnails, comments, fx_comments, last=fx_screenshots == "last")
 
         # Add horizontal line between the header and the comments/screenshots
-        if len(extras) > 0 and len(links) + len(rows) > 0:
-            extras.append(pytest_html.extras.html(f'<hr class="extras_separator">'))
+        if len(extras) > 0 and steps != "":
+            extras.append(pytest_html.extras.html(utils.get_separator()))
 
         # Append extras
-        if links != "":
-            extras.append(pytest_html.extras.html(links))
-        if rows != "":
-            rows = (
-                '<table style="width: 100%;">'
-                + rows +
-                "</table>"
-            )
-            extras.append(pytest_html.extras.html(rows))
+        if steps != "":
+            extras.append(pytest_html.extras.html(steps))
         report.extras = extras
 
         # Log error message if there was a screenshot gathering failure
         if fx_screenshots != 'none':
             for image in images:
-                if image == f"screenshots{os.sep}error.png":
+                if image == f"screenshots{os.sep}error.png" or (
+                    isinstance(image, list) and f"screenshots{os.sep}error.png" in image
+                ):
                     message = "Failure gathering screenshot(s)"
                     utils.log_error_message(report, message)
                     break
@@ -0,0 +1,138 @@
+"""
+Compressed storage of the webpage sources.
+
+The webpage sources are written gzip-compressed, either in full or as the difference
+with the previous webpage source of the test (delta), with a full snapshot every few steps.
+The links of the report keep pointing to 'sources/page-N.txt':
+the webpage sources are decompressed or reconstructed on demand by the 'serve' and 'extract' commands
+of the pytest_webtest_extras.pack module.
+"""
+import gzip
+import json
+import os
+import re
+
+
+GZIP_SUFFIX = ".gz"
+DELTA_SUFFIX = ".delta.gz"
+# Number of tokens of the blocks of the previous webpage source looked up in the new one
+BLOCK = 8
+
+_token = re.compile(r'[^>\n]*[>\n]|[^>\n]+')
+
+
+def tokenize(source):
+    """ Splits a webpage source after each tag and line. """
+    if '\0' in source:
+        return _token.findall(source)
+    # Faster than the regular expression
+    tokens = source.replace('\n', '\n\0').replace('>', '>\0').split('\0')
+    if tokens[-1] == '':
+        tokens.pop()
+    return tokens
+
+
+def diff(base, source):
+    """
+    Returns the operations rebuilding a webpage source from a previous one:
+    [start, length] pairs copying tokens of the previous webpage source, and strings to insert.
+
+    Args:
+        base (str): The previous webpage source.
+        source (str): The webpage source.
+    """
+    a = tokenize(base)
+    b = tokenize(source)
+    blocks = {}
+    for i in range(0, len(a) - BLOCK + 1, BLOCK):
+        blocks.setdefault("".join(a[i:i + BLOCK]), i)
+    ops = []
+    literal = []
+    j = 0
+    while j < len(b):
+        i = blocks.get("".join(b[j:j + BLOCK])) if j + BLOCK <= len(b) else None
+        if i is None:
+            literal.append(b[j])
+            j += 1
+            continue
+        length = BLOCK
+        # Extend the match by slices, then token by token
+        step = 256
+        while step > 0:
+            while a[i + length:i + length + step] == b[j + length:j + length + step] and \
+                    i + length + step <= len(a) and j + length + step <= len(b):
+                length += step
+            step //= 4
+        j += length
+        # Extend the match backwards over the tokens not matched yet
+        while len(literal) > 0 and i > 0 and a[i - 1] == literal[-1]:
+            literal.pop()
+            i -= 1
+            length += 1
+        if len(literal) > 0:
+            ops.append("".join(literal))
+            literal = []
+        if len(ops) > 0 and isinstance(ops[-1], list) and ops[-1][0] + ops[-1][1] == i:
+            ops[-1][1] += length
+        else:
+            ops.append([i, length])
+    if len(literal) > 0:
+        ops.append("".join(literal))
+    return ops
+
+
+def patch(base, ops):
+    """ Rebuilds a webpage source from the previous one and the operations returned by 'diff'. """
+    a = tokenize(base)
+    return "".join(op if isinstance(op, str) else "".join(a[op[0]:op[0] + op[1]]) for op in ops)
+
+
+def encode(source, base_link=None, base=None):
+    """
+    Returns a webpage source compressed, in full or as the difference with a previous webpage source.
+
+    Args:
+        source (str): The webpage source.
+        base_link (str): The link of the previous webpage source. None to compress the webpage source in full.
+        base (str): The previous webpage source.
+
+    Returns:
+        tuple: The suffix of the file name and the compressed content.
+    """
+    if base_link is None:
+        return GZIP_SUFFIX, gzip.compress(source.encode("utf-8"), compresslevel=6, mtime=0)
+    delta = json.dumps({"base": base_link.replace(os.sep, '/'), "ops": diff(base, source)}, separators=(',', ':'))
+    return DELTA_SUFFIX, gzip.compress(delta.encode("utf-8"), compresslevel=6, mtime=0)
+
+
+def read(link, read_file):
+    """
+    Returns a webpage source, decompressed or rebuilt from its previous webpage sources.
+
+    Args:
+        link (str): The link of the webpage source, with forward slashes.
+        read_file (function): Called as read_file(link). Returns the content of a file of the report folder.
+                              None if the file doesn't exist.
+
+    Returns:
+        str: The webpage source. None if the webpage source is not found.
+    """
+    deltas = []
+    while True:
+        data = read_file(link + GZIP_SUFFIX)
+        if data is not None:
+            source = gzip.decompress(data).decode("utf-8")
+            break
+        data = read_file(link + DELTA_SUFFIX)
+        if data is None:
+            data = read_file(link)
+            if data is None:
+                return None
+            source = data.decode("utf-8")
+            break
+        delta = json.loads(gzip.decompress(data))
+        deltas.append(delta["ops"])
+        link = delta["base"]
+    for ops in reversed(deltas):
+        source = patch(source, ops)
+    return source
@@ -1,11 +1,21 @@
 import base64
+import hashlib
 import html
+import importlib
+import io
+import json
 import os
 import pathlib
 import pytest
 import shutil
+import struct
 import sys
+import tempfile
+import threading
+import time
 import traceback
+import zlib
+from . import sources as source_storage
 
 
 #
@@ -29,6 +39,52 @@ def getini(config, name):
     return value
 
 
+def get_worker_id(config):
+    """
+    Returns the id of the pytest-xdist worker running the tests.
+    None if the tests are not being run by a pytest-xdist worker.
+    """
+    if hasattr(config, "workerinput"):
+        return config.workerinput["workerid"]
+    return None
+
+
+def is_distributed(config):
+    """ Whether the tests are distributed among pytest-xdist workers. """
+    return (
+        getattr(config.option, "dist", "no") != "no" or
+        bool(getattr(config.option, "numprocesses", None))
+    )
+
+
+def get_screenshots_policy(value):
+    """
+    Parses a value of the extras_screenshots option.
+
+    Args:
+        value (str): all, last, on-failure, none, every:N, interval:T or ring:K.
+
+    Returns:
+        tuple: The mode and its parameter: the number of steps between screenshots in 'every' mode,
+               the minimum time in seconds between screenshots in 'interval' mode
+               and the number of last screenshots kept in 'ring' mode. None for the other modes.
+               None if the value is not valid.
+    """
+    if value in ("all", "last", "on-failure", "none"):
+        return value, None
+    mode, _, parameter = value.partition(':')
+    cast = {"every": int, "interval": float, "ring": int}.get(mode)
+    if cast is None:
+        return None
+    try:
+        parameter = cast(parameter)
+    except ValueError:
+        return None
+    if parameter <= 0:
+        return None
+    return mode, parameter
+
+
 def get_folder(filepath):
     """
     Returns the folder of a filepath.
@@ -53,59 +109,408 @@ def check_lists_length(report, fx_extras):
         return True
 
 
-def create_assets(report_folder):
-    """ Recreate screenshots and webpage sources folders. """
-    # Recreate screenshots_folder
+def create_assets(report_folder, history_runs=0, history_size=0):
+    """
+    Recreate screenshots, webpage sources, payloads and packs folders.
+    The files of the previous run are moved to the history folder, which is pruned in a background thread,
+    so that the session start doesn't depend on the size of the previous run.
+
+    Args:
+        report_folder (str): The folder storing the pytest-html report.
+        history_runs (int): The number of previous runs to keep in the history folder.
+        history_size (int): The maximum size in bytes of the history folder. 0 for no limit.
+
+    Returns:
+        threading.Thread: The thread pruning the history folder.
+    """
     folder = ""
     if report_folder is not None and report_folder != '':
         folder = f"{report_folder}{os.sep}"
-    # Create page sources folder
-    shutil.rmtree(f"{folder}sources", ignore_errors=True)
+    history = f"{folder}history"
+    # Move the files of the previous run aside
+    run = None
+    for name in ("sources", "payloads", "packs", "screenshots", "manifest.jsonl"):
+        if not os.path.lexists(f"{folder}{name}"):
+            continue
+        try:
+            if run is None:
+                pathlib.Path(history).mkdir(parents=True, exist_ok=True)
+                run = tempfile.mkdtemp(prefix=time.strftime("run-%Y%m%d-%H%M%S-"), dir=history)
+            os.rename(f"{folder}{name}", f"{run}{os.sep}{name}")
+        except OSError:
+            _remove(f"{folder}{name}")
+    # Create page sources, payloads and screenshots folders
     pathlib.Path(f"{folder}sources").mkdir(parents=True)
-    # Create screenshots folder
-    shutil.rmtree(f"{folder}screenshots", ignore_errors=True)
+    pathlib.Path(f"{folder}payloads").mkdir(parents=True)
     pathlib.Path(f"{folder}screenshots").mkdir(parents=True)
     # Copy error.png to screenshots folder
     resources_path = pathlib.Path(__file__).parent.joinpath("resources")
     error_img = pathlib.Path(resources_path, "error.png")
     shutil.copy(str(error_img), f"{folder}screenshots")
+    # Prune the history folder in the background
+    thread = threading.Thread(target=prune_history, args=(history, history_runs, history_size),
+                              name="extras-cleanup", daemon=True)
+    thread.start()
+    return thread
+
+
+def prune_history(history, runs=0, size=0):
+    """
+    Deletes the oldest runs of the history folder, the ones exceeding the number of runs to keep first,
+    then the ones exceeding the size budget.
+    The runs left by an interrupted deletion are deleted by the next session.
+
+    Args:
+        history (str): The history folder.
+        runs (int): The number of runs to keep.
+        size (int): The maximum size in bytes of the kept runs. 0 for no limit.
+    """
+    try:
+        entries = sorted(entry.path for entry in os.scandir(history) if entry.is_dir(follow_symlinks=False))
+    except OSError:
+        return
+    evicted = entries[:max(0, len(entries) - runs)]
+    kept = entries[len(evicted):]
+    if size > 0 and len(kept) > 0:
+        sizes = [_get_size(run) for run in kept]
+        total = sum(sizes)
+        while len(kept) > 0 and total > size:
+            evicted.append(kept.pop(0))
+            total -= sizes.pop(0)
+    for run in evicted:
+        shutil.rmtree(run, ignore_errors=True)
+
+
+def _get_size(path):
+    """ Returns the size in bytes of the files of a folder tree. """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path):
+    """ Deletes a file or folder tree. """
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def open_manifest(report_folder):
+    """
+    Creates the manifest of the screenshots and webpage sources of the session, in JSON Lines format.
+
+    Args:
+        report_folder (str): The folder storing the pytest-html report.
+
+    Returns:
+        TextIO: The manifest file. None if the file could not be created.
+    """
+    folder = ""
+    if report_folder is not None and report_folder != '':
+        folder = f"{report_folder}{os.sep}"
+    try:
+        return open(f"{folder}manifest.jsonl", 'w', encoding="utf-8")
+    except Exception as e:
+        trace = traceback.format_exc()
+        print(f"{str(e)}\n\n{trace}", file=sys.stderr)
+        return None
+
+
+def write_manifest(manifest, records):
+    """
+    Appends records to the manifest of the session, one line per record, and flushes them.
+
+    Args:
+        manifest (TextIO): The manifest file.
+        records (list): The manifest records of the steps of a test.
+    """
+    try:
+        manifest.write("".join(json.dumps(record) + '\n' for record in records))
+        manifest.flush()
+    except Exception as e:
+        trace = traceback.format_exc()
+        print(f"{str(e)}\n\n{trace}", file=sys.stderr)
 
 
 #
 # Persistence functions
 #
-def get_full_page_screenshot_chromium(driver):
+def get_full_page_screenshot_chromium(driver, image_format="png", quality=None, max_height=0):
     # get window size
     page_rect = driver.execute_cdp_cmd("Page.getLayoutMetrics", {})
+    height = page_rect['contentSize']['height']
+    if max_height > 0:
+        height = min(height, max_height)
     # parameters needed for full page screenshot
     # note we are setting the width and height of the viewport to screenshot, same as the site's content size
     screenshot_config = {
         'captureBeyondViewport': True,
         'fromSurface': True,
-        'format': "png",
+        'format': image_format,
         'clip': {
             'x': 0,
             'y': 0,
             'width': page_rect['contentSize']['width'],
-            'height': page_rect['contentSize']['height'],
+            'height': height,
             'scale': 1,
         },
     }
+    if quality is not None and image_format in ("jpeg", "webp"):
+        screenshot_config['quality'] = quality
     # Dictionary with 1 key: data
     base_64_png = driver.execute_cdp_cmd("Page.captureScreenshot", screenshot_config)
     return base64.urlsafe_b64decode(base_64_png['data'])
 
 
-def save_image(report_folder, index, image):
-    link = f"screenshots{os.sep}image-{index}.png"
+def get_full_page_screenshot_chromium_tiled(driver, tile_height, max_height=0, timeout=0):
+    """
+    Takes a full-page screenshot by capturing clips of fixed height and stitching them
+    into a PNG image as they are captured, so that only one decoded clip is held in memory at a time.
+    Requires the Pillow package.
+
+    Args:
+        driver (WebDriver): The Chromium based webdriver.
+        tile_height (int): The height in pixels of each clip.
+        max_height (int): The maximum height in pixels of the screenshot. 0 for no limit.
+        timeout (float): The time budget in seconds. When exceeded, the screenshot is truncated. 0 for no limit.
+
+    Returns:
+        bytes: The PNG screenshot.
+    """
+    from PIL import Image
+    page_rect = driver.execute_cdp_cmd("Page.getLayoutMetrics", {})
+    content_width = page_rect['contentSize']['width']
+    content_height = page_rect['contentSize']['height']
+    if max_height > 0:
+        content_height = min(content_height, max_height)
+    start = time.monotonic()
+    compressor = zlib.compressobj(6)
+    idat = []
+    width = None
+    height = 0
+    y = 0
+    while y < content_height:
+        if timeout > 0 and time.monotonic() - start > timeout:
+            print(f"Full-page screenshot truncated at {y}px after exceeding the {timeout}s timeout.", file=sys.stderr)
+            break
+        clip_height = min(tile_height, content_height - y)
+        response = driver.execute_cdp_cmd("Page.captureScreenshot", {
+            'captureBeyondViewport': True,
+            'fromSurface': True,
+            'format': "png",
+            'clip': {'x': 0, 'y': y, 'width': content_width, 'height': clip_height, 'scale': 1},
+        })
+        tile = Image.open(io.BytesIO(base64.b64decode(response['data']))).convert("RGB")
+        response = None
+        if width is None:
+            width = tile.width
+        elif tile.width != width:
+            tile = tile.crop((0, 0, width, tile.height))
+        raw = tile.tobytes()
+        stride = width * 3
+        # Each row of a PNG image is preceded by its filter type (0: None)
+        idat.append(compressor.compress(b"".join(
+            b"\x00" + raw[offset:offset + stride] for offset in range(0, len(raw), stride)
+        )))
+        height += tile.height
+        y += clip_height
+        tile = raw = None
+    idat.append(compressor.flush())
+    if width is None:
+        raise ValueError("Empty page")
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+        _png_chunk(b"IDAT", b"".join(idat)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+
+def _png_chunk(chunk_type, data):
+    """ Returns a PNG chunk: length, type, data and CRC. """
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def get_image_link(index, image_format="png"):
+    """ Returns the link, relative to the report folder, of a screenshot file. """
+    extension = "jpg" if image_format == "jpeg" else image_format
+    return f"screenshots{os.sep}image-{index}.{extension}"
+
+
+def get_image_format(image):
+    """
+    Returns the format of an image: png, jpeg or webp.
+    None if the format is not recognized.
+    """
+    if not isinstance(image, bytes):
+        return None
+    if image.startswith(b"\x89PNG"):
+        return "png"
+    if image.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if image.startswith(b"RIFF") and image[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def get_image_format_from_link(link):
+    """ Returns the format of an image file from its extension: png, jpeg or webp. """
+    extension = os.path.splitext(link)[1].lower()
+    return {".jpg": "jpeg", ".webp": "webp"}.get(extension, "png")
+
+
+def get_allure_attachment_type(image_format):
+    """
+    Returns the Allure attachment type and extension of an image format.
+    The extension is None if implied by the attachment type.
+    """
+    import allure
+    if image_format == "jpeg":
+        return allure.attachment_type.JPG, None
+    if image_format == "webp":
+        return "image/webp", "webp"
+    return allure.attachment_type.PNG, None
+
+
+def get_path(report_folder, link):
+    """ Returns the path of a file from its link, relative to the report folder. """
+    if report_folder is not None and report_folder != '':
+        return f"{report_folder}{os.sep}{link}"
+    return link
+
+
+def convert_image(image, image_format, quality=None):
+    """
+    Converts an image to another format. Requires the Pillow package.
+
+    Args:
+        image (bytes): The image to convert.
+        image_format (str): The target format: png, jpeg or webp.
+        quality (int): The quality of JPEG and WebP images.
+    """
+    from PIL import Image
+    img = Image.open(io.BytesIO(image))
+    if image_format == "jpeg" and img.mode != "RGB":
+        img = img.convert("RGB")
+    options = {} if quality is None or image_format == "png" else {'quality': quality}
+    buffer = io.BytesIO()
+    img.save(buffer, image_format.upper(), **options)
+    return buffer.getvalue()
+
+
+def get_thumbnail_link(index):
+    """ Returns the link, relative to the report folder, of a screenshot preview file. """
+    return f"screenshots{os.sep}thumbnail-{index}.jpg"
+
+
+def get_source_link(index):
+    """ Returns the link, relative to the report folder, of a webpage source file. """
+    return f"sources{os.sep}page-{index}.txt"
+
+
+def get_signature(image, size=64):
+    """
+    Returns the signature of a screenshot used to detect near-duplicates:
+    its size and a downscaled grayscale version of it. Requires the NumPy and Pillow packages.
+
+    Args:
+        image (bytes): The screenshot.
+        size (int): The width and height of the downscaled version.
+
+    Returns:
+        tuple: The size of the screenshot and the downscaled version as a NumPy array.
+               None if the screenshot could not be decoded.
+    """
+    import numpy
+    from PIL import Image
+    try:
+        img = Image.open(io.BytesIO(image))
+        original = img.size
+        img = img.convert("RGB").resize((size, size), Image.BOX, reducing_gap=2.0).convert("L")
+        return original, numpy.asarray(img, dtype=numpy.int16)
+    except Exception:
+        return None
+
+
+def get_difference(signature1, signature2):
+    """
+    Returns the mean absolute difference between the downscaled versions of two screenshots,
+    from 0 (identical) to 1. Screenshots of different sizes are considered different.
+    """
+    if signature1 is None or signature2 is None or signature1[0] != signature2[0]:
+        return 1.0
+    import numpy
+    return float(numpy.abs(signature1[1] - signature2[1]).mean()) / 255
+
+
+def get_digest(data):
+    """
+    Returns the hash of the content of a screenshot or webpage source.
+
+    Args:
+        data (bytes | str): The content to hash.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def set_stored(stored, data):
+    """
+    Sets the size in bytes and the hash of the content written for a file.
+
+    Args:
+        stored (dict): The dict to update with the 'size' and 'hash' of the content. None to skip.
+        data (bytes | str): The content written. Strings are written in UTF-8.
+    """
+    if stored is None:
+        return
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    stored["size"] = len(data)
+    stored["hash"] = get_digest(data)
+
+
+def save_image(report_folder, index, image, image_format="png", quality=None, pack=None, stored=None):
+    """
+    Writes a screenshot, converted to the requested format if possible.
+
+    Args:
+        stored (dict): Updated with the size and hash of the written file (see 'set_stored').
+
+    Returns:
+        str: The link of the screenshot. The link of the error image if the screenshot could not be written.
+    """
+    link = get_image_link(index, image_format)
     folder = ""
     if report_folder is not None and report_folder != '':
         folder = f"{report_folder}{os.sep}"
-    filename = folder + link
     try:
-        f = open(filename, 'wb')
-        f.write(image)
-        f.close()
+        # Convert the screenshots not taken natively in the requested format.
+        # Without the Pillow package, they are kept in their original format.
+        actual = get_image_format(image)
+        if actual is not None and actual != image_format:
+            if importlib.util.find_spec('PIL') is not None:
+                image = convert_image(image, image_format, quality)
+            else:
+                link = get_image_link(index, actual)
+        if pack is not None:
+            pack.write(link, image)
+        else:
+            filename = folder + link
+            f = open(filename, 'wb')
+            f.write(image)
+            f.close()
+        set_stored(stored, image)
     except Exception as e:
         trace = traceback.format_exc()
         link = f"screenshots{os.sep}error.png"
@@ -114,24 +519,139 @@ def save_image(report_folder, index, image):
         return link
 
 
-def save_source(report_folder, index, source):
-    link = f"sources{os.sep}page-{index}.txt"
+def save_thumbnail(report_folder, index, image, width=600, height=340, quality=70, pack=None):
+    """
+    Writes a downscaled JPEG preview of the top of a screenshot.
+    The default size is twice the size of the 'extras_image' CSS class, for high density displays.
+    Requires the Pillow package.
+
+    Returns:
+        str: The link of the preview. None if the preview could not be written.
+    """
+    from PIL import Image
+    link = get_thumbnail_link(index)
+    folder = ""
+    if report_folder is not None and report_folder != '':
+        folder = f"{report_folder}{os.sep}"
+    filename = folder + link
+    try:
+        img = Image.open(io.BytesIO(image))
+        ratio = min(1, width / img.width)
+        # Only the top of the screenshot is displayed in the report.
+        img = img.crop((0, 0, img.width, min(img.height, round(height / ratio))))
+        if ratio < 1:
+            img = img.resize((width, max(1, round(img.height * ratio))), Image.BILINEAR)
+        if pack is not None:
+            buffer = io.BytesIO()
+            img.convert("RGB").save(buffer, "JPEG", quality=quality)
+            pack.write(link, buffer.getvalue())
+        else:
+            img.convert("RGB").save(filename, "JPEG", quality=quality)
+    except Exception as e:
+        trace = traceback.format_exc()
+        link = None
+        print(f"{str(e)}\n\n{trace}", file=sys.stderr)
+    finally:
+        return link
+
+
+def save_source(report_folder, index, source, compression=None, base=None, pack=None, stored=None):
+    """
+    Writes a webpage source, compressed if requested.
+    The link of a compressed webpage source is the link of the uncompressed file.
+
+    Args:
+        compression (str): None, 'gzip' or 'delta'.
+        base (tuple): The link and content of the previous webpage source,
+                      if the webpage source is written as the difference with it.
+        pack (Pack): The pack to append the file to, instead of writing it in the 'sources' folder.
+        stored (dict): Updated with the size and hash of the written file (see 'set_stored'),
+                       compressed if the webpage source is compressed.
+
+    Returns:
+        str: The link of the webpage source. None if the webpage source could not be written.
+    """
+    link = get_source_link(index)
+    folder = ""
+    if report_folder is not None and report_folder != '':
+        folder = f"{report_folder}{os.sep}"
+    filename = folder + link
+    try:
+        if compression is not None:
+            suffix, data = source_storage.encode(source, *(base or (None, None)))
+        else:
+            suffix, data = "", source.encode("utf-8")
+        if pack is not None:
+            pack.write(link + suffix, data)
+        else:
+            # Written as bytes, so that the file is the content described by 'stored'
+            f = open(filename + suffix, 'wb')
+            f.write(data)
+            f.close()
+        set_stored(stored, data)
+    except Exception as e:
+        trace = traceback.format_exc()
+        link = None
+        print(f"{str(e)}\n\n{trace}", file=sys.stderr)
+    finally:
+        return link
+
+
+def save_payload(report_folder, index, extension, formatter, filepath, indent):
+    """
+    Writes the formatted content of a document file in the payloads folder.
+
+    Args:
+        report_folder (str): The folder storing the pytest-html report.
+        index (int | str): The suffix of the file name.
+        extension (str): The extension of the file.
+        formatter (function): The function writing the formatted document.
+        filepath (str): The document file.
+        indent (int): The indentation width.
+
+    Returns:
+        str: The link of the file. None if the file could not be written.
+    """
+    link = f"payloads{os.sep}payload-{index}.{extension}"
     folder = ""
     if report_folder is not None and report_folder != '':
         folder = f"{report_folder}{os.sep}"
     filename = folder + link
     try:
         f = open(filename, 'w', encoding="utf-8")
-        f.write(source)
-        f.close()
+        try:
+            formatter(filepath, f, indent)
+        finally:
+            f.close()
     except Exception as e:
         trace = traceback.format_exc()
         link = None
         print(f"{str(e)}\n\n{trace}", file=sys.stderr)
+        # Don't leave a partially formatted document
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
     finally:
         return link
 
 
+def read_payload(report_folder, link, size):
+    """ Returns the beginning of a file of the payloads folder. """
+    folder = ""
+    if report_folder is not None and report_folder != '':
+        folder = f"{report_folder}{os.sep}"
+    return read_head(folder + link, size)
+
+
+def read_head(filepath, size):
+    """ Returns the first characters of a text file. Undecodable bytes are replaced. """
+    f = open(filepath, 'r', encoding="utf-8", errors="replace")
+    content = f.read(size)
+    f.close()
+    return content
+
+
 #
 # Auxiliary functions for the report generation
 #
@@ -144,7 +664,6 @@ def append_header(call, report, extras, pytest_html,
         description (str): The test function docstring.
         description_tag (str): The HTML tag to use.
     """
-    clazz = "extras_exception"
     # Append description
     if description is not None:
         description = escape_html(description).strip().replace('\n', "<br>")
@@ -158,31 +677,15 @@ def append_header(call, report, extras, pytest_html,
         hasattr(call.excinfo, "value") and
         hasattr(call.excinfo.value, "msg")
     ):
-        extras.append(pytest_html.extras.html(
-            "<pre>"
-            f'<span class="{clazz}">{escape_html(call.excinfo.typename)}</span>'
-            f" reason = {escape_html(call.excinfo.value.msg)}"
-            "</pre>"
-            )
-        )
+        extras.append(pytest_html.extras.html(_exception(
+            escape_html(call.excinfo.typename), f" reason = {escape_html(call.excinfo.value.msg)}"
+        )))
     # Catch XFailed tests
     if report.skipped and hasattr(report, 'wasxfail'):
-        extras.append(pytest_html.extras.html(
-            "<pre>"
-            f'<span class="{clazz}">XFailed</span>'
-            f" reason = {escape_html(report.wasxfail)}"
-            "</pre>"
-            )
-        )
+        extras.append(pytest_html.extras.html(_exception("XFailed", f" reason = {escape_html(report.wasxfail)}")))
     # Catch XPassed tests
     if report.passed and hasattr(report, 'wasxfail'):
-        extras.append(pytest_html.extras.html(
-            "<pre>"
-            f'<span class="{clazz}">XPassed</span>'
-            f" reason = {escape_html(report.wasxfail)}"
-            "</pre>"
-            )
-        )
+        extras.append(pytest_html.extras.html(_exception("XPassed", f" reason = {escape_html(report.wasxfail)}")))
     # Catch explicit pytest.xfail calls and runtime exceptions in failed tests
     if (
         hasattr(call, 'excinfo') and
@@ -193,13 +696,9 @@ def append_header(call, report, extras, pytest_html,
         isinstance(call.excinfo._excinfo, tuple) and
         len(call.excinfo._excinfo) > 1
     ):
-        extras.append(pytest_html.extras.html(
-            "<pre>"
-            f'<span class="{clazz}">{escape_html(call.excinfo.typename)}</span>'
-            f" {escape_html(call.excinfo._excinfo[1])}"
-            "</pre>"
-            )
-        )
+        extras.append(pytest_html.extras.html(_exception(
+            escape_html(call.excinfo.typename), f" {escape_html(call.excinfo._excinfo[1])}"
+        )))
     report.extras = extras
 
 
@@ -208,39 +707,98 @@ def escape_html(text):
     return html.escape(str(text))
 
 
-def get_table_row_tag(comment, image, source):
+#
+# HTML fragments of the report.
+# The CSS classes are part of the f-string literals, compiled once with the module.
+#
+def _row(comment, content):
+    return f'<tr><td>{comment}</td><td class="extras_td"><div class="extras_td_div">{content}</div></td></tr>'
+
+
+def _comment(comment):
+    return f'<span class="extras_comment">{comment}</span>'
+
+
+def _div(content):
+    return f'<div class="extras_div">{content}</div>'
+
+
+def _div_source(image, source):
+    return f'<div class="extras_div">{image}<br>{source}</div>'
+
+
+def _screenshot(filename, src):
+    return f'<a href="{filename}" target="_blank"><img src ="{src}" class="extras_image" loading="lazy"></a>'
+
+
+def _page_source(filename):
+    return f'<a href="{filename}" target="_blank" class="extras_page_src">[page source]</a>'
+
+
+def _payload(link, description):
+    return f'<a href="{link}" target="_blank" class="extras_payload">{description}</a>'
+
+
+def _exception(label, message):
+    return f'<pre><span class="extras_exception">{label}</span>{message}</pre>'
+
+
+def render_steps(images, sources, thumbnails, comments, fx_comments, last=False):
+    """
+    Returns the HTML code of the steps of a test.
+    The fragments of the steps are built by get_table_row_tag or decorate_anchors, gathered in a list and joined once.
+
+    Args:
+        images (list): The screenshots of the steps.
+        sources (list): The page sources of the steps.
+        thumbnails (list): The screenshot previews of the steps.
+        comments (list): The comments of the steps.
+        fx_comments (bool): Whether to render the steps in a table, with their comments.
+        last (bool): Whether to render the last step only.
+
+    Returns:
+        str: The HTML code. Empty string if there are no steps.
+    """
+    start = len(images) - 1 if last else 0
+    if start < 0:
+        return ""
+    fragments = ['<table style="width: 100%;">'] if fx_comments else []
+    append = fragments.append
+    for i in range(start, len(images)):
+        if fx_comments:
+            append(get_table_row_tag(comments[i], images[i], sources[i], thumbnails[i]))
+        else:
+            append(decorate_anchors(images[i], sources[i], thumbnails[i]))
+    if fx_comments:
+        append("</table>")
+    return "".join(fragments)
+
+
+def get_separator():
+    """ Returns the horizontal line between the header and the comments/screenshots. """
+    return '<hr class="extras_separator">'
+
+
+def get_table_row_tag(comment, image, source, thumbnail=None):
     """
     Returns the HTML table row of a test step.
 
     Args:
         comment (str): The comment of the test step.
-        image (str): The screenshot anchor element.
-        source (str): The page source anchor element.
+        image (str | list[str]): The screenshot anchor element, or the screenshots of a grouped step.
+        source (str | list[str]): The page source anchor element, or the page sources of a grouped step.
+        thumbnail (str | list[str]): The screenshot preview, if any, or the previews of a grouped step.
 
     Returns:
         str: The <tr> element.
     """
-    clazz = "extras_comment"
-    image = decorate_screenshot(image)
-    if isinstance(comment, str):
-        comment = decorate_label(comment, clazz)
-    else:
-        comment = ""
-    if source is not None:
-        source = decorate_page_source(source)
-        return (
-            f"<tr>"
-            f"<td>{comment}</td>"
-            f'<td class="extras_td"><div class="extras_td_div">{image}<br>{source}</div></td>'
-            f"</tr>"
-        )
+    if isinstance(image, list):
+        content = decorate_group(image, source, thumbnail)
     else:
-        return (
-            f"<tr>"
-            f"<td>{comment}</td>"
-            f'<td class="extras_td"><div class="extras_td_div">{image}</div></td>'
-            "</tr>"
-        )
+        content = decorate_screenshot(image, thumbnail)
+        if source is not None:
+            content += "<br>" + _page_source(source)
+    return _row(_comment(comment) if isinstance(comment, str) else "", content)
 
 
 def decorate_label(label, clazz):
@@ -257,26 +815,48 @@ def decorate_label(label, clazz):
     return f'<span class="{clazz}">{label}</span>'
 
 
-def decorate_anchors(image, source):
+def decorate_anchors(image, source, thumbnail=None):
     """ Applies CSS style to a screenshot and page source anchor elements. """
-    image = decorate_screenshot(image)
+    if isinstance(image, list):
+        return decorate_group(image, source, thumbnail)
+    image = decorate_screenshot(image, thumbnail)
     if source is not None:
-        source = decorate_page_source(source)
-        return f'<div class="extras_div">{image}<br>{source}</div>'
+        return _div_source(image, _page_source(source))
     else:
         return image
 
 
-def decorate_screenshot(filename):
-    """ Applies CSS style to a screenshot anchor element. """
-    clazz = "extras_image"
-    return f'<a href="{filename}" target="_blank"><img src ="{filename}" class="{clazz}"></a>'
+def decorate_group(images, sources, thumbnails):
+    """ Applies CSS style to the screenshot and page source anchor elements of a grouped step. """
+    return "".join([
+        _div(decorate_screenshot(images[i], thumbnails[i])) if sources[i] is None
+        else _div_source(decorate_screenshot(images[i], thumbnails[i]), _page_source(sources[i]))
+        for i in range(len(images))
+    ])
+
+
+def decorate_screenshot(filename, thumbnail=None):
+    """
+    Applies CSS style to a screenshot anchor element.
+    The image element displays the screenshot preview, if any, and is loaded lazily.
+    """
+    return _screenshot(filename, filename if thumbnail is None else thumbnail)
+
+
+def decorate_payloads(payloads):
+    """
+    Returns the anchor elements of the documents written in the payloads folder.
+
+    Args:
+        payloads (list): The (description, link) tuples of the documents.
+    """
+    anchors = "<br>".join([_payload(link, escape_html(description)) for description, link in payloads])
+    return f'<div class="extras_payloads">{anchors}</div>'
 
 
 def decorate_page_source(filename):
     """ Applies CSS style to a page source anchor element. """
-    clazz = "extras_page_src"
-    return f'<a href="{filename}" target="_blank" class="{clazz}">[page source]</a>'
+    return _page_source(filename)
 
 
 def log_error_message(report, message):
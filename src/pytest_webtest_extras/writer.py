@@ -0,0 +1,41 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Writer:
+    """
+    Bounded thread pool used to persist screenshots and webpage sources in the background.
+    """
+
+    def __init__(self, max_workers=4, max_pending=None):
+        """
+        Args:
+            max_workers (int): The number of writer threads.
+            max_pending (int): The maximum number of queued writes.
+                               Further submissions block until a slot is released.
+                               Defaults to 4 times the number of writer threads.
+        """
+        if max_pending is None:
+            max_pending = max_workers * 4
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extras-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedules a write operation.
+
+        Returns:
+            concurrent.futures.Future: The future holding the result of the write operation.
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def shutdown(self):
+        """ Waits for the pending write operations and releases the writer threads. """
+        self._executor.shutdown(wait=True)